@@ -0,0 +1,493 @@
+'''
+times each stage of a photo mosaic, `get_frames`, `generate_new_image`, \
+`create_mosaic` and `save`, on synthetic tile folders and target images \
+made on the fly, so it runs offline and needs neither `ffmpeg` nor `youtube-dl`.
+
+```bash
+python benchmarks/stages.py --scales small medium --output results.json
+```
+
+tiles and targets are deterministic and kept in `benchmarks/data`, \
+so runs on different commits are comparable
+'''
+
+from argparse   import ArgumentParser
+from subprocess import run
+from time       import strftime, perf_counter
+from PIL        import Image
+
+import tracemalloc
+import platform
+import tempfile
+import random
+import shutil
+import json
+import sys
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from mozaiku.mosaic     import MOSAIC
+from mozaiku.matching   import HAS_NUMPY
+from mozaiku.metrics    import Metrics
+
+
+
+# number of tiles, side of the target image and `image_max_size` of each scale
+
+SCALES = {
+    'small':  {'tiles': 1000,   'target': 100,  'image_max_size': 100},
+    'medium': {'tiles': 10000,  'target': 500,  'image_max_size': 250},
+    'large':  {'tiles': 100000, 'target': 2000, 'image_max_size': 500}
+}
+
+STAGES = ('get_frames', 'generate_new_image', 'create_mosaic', 'save')
+
+
+
+## =============== SYNTHETIC DATA =============== ##
+
+
+
+def make_tiles(folder: str, count: int, seed: int = 0) -> None:
+    '''
+    fills `folder` with `count` frames, each made of two rectangles \
+    of random colours, unless it's already full
+    '''
+
+    if os.path.isdir(folder) and len(os.listdir(folder)) == count:
+        return
+
+    shutil.rmtree(folder, ignore_errors = True)
+    os.makedirs(folder)
+
+    rand = random.Random(seed)
+
+    for i in range(count):
+        width, height = rand.randint(32, 64), rand.randint(32, 64)
+
+        image = Image.new('RGB', (width, height), tuple(rand.randrange(256) for _ in range(3)))
+        image.paste(
+            tuple(rand.randrange(256) for _ in range(3)),
+            (0, 0, rand.randint(1, width), height)
+        )
+
+        image.save(f'{folder}/{i:06d}.png')
+
+
+
+def make_target(path: str, size: int) -> None:
+    '''
+    saves as `path` a `size` by `size * 3 / 4` target image \
+    made of gradients and a fractal, unless it exists
+    '''
+
+    if os.path.exists(path):
+        return
+
+    width, height = size, max(1, size * 3 // 4)
+
+    red = Image.linear_gradient('L').rotate(90).resize((width, height))
+    green = Image.radial_gradient('L').resize((width, height))
+    blue = Image.effect_mandelbrot((width, height), (-2, -1.5, 1, 1.5), 100)
+
+    Image.merge('RGB', (red, green, blue)).save(path)
+
+
+
+## =============== BENCHMARK =============== ##
+
+
+
+def run_stages(
+        tiles: str,
+        target: str,
+        image_max_size: int,
+        frames_size: int,
+        output: str,
+
+        workers: int = 1,
+        trace: bool = False
+    ) -> dict:
+    '''
+    creates the mosaic of `target` with the frames in `tiles` \
+    one stage at a time, and returns, for each stage, its `Metrics`, \
+    its throughput and, if `trace` is set, the peak memory \
+    allocated during it, as traced by `tracemalloc`
+    '''
+
+    mosaic = MOSAIC(
+        image_path = target,
+        output_file_name = output,
+        sample_image = None,
+        image_max_size = image_max_size,
+        frames_size = frames_size,
+        folder_path = tiles,
+        log = False,
+        clear = False,
+        workers = workers,
+        metrics = Metrics()
+    )
+
+    image = None
+    stages = {}
+
+    def get_frames():
+        mosaic.get_frames()
+
+        return len(mosaic.result) - 1, 'frames/s'
+
+    def generate_new_image():
+        mosaic.generate_new_image()
+
+        return mosaic.new_size[0] * mosaic.new_size[1], 'cells/s'
+
+    def create_mosaic():
+        nonlocal image
+        image = mosaic.create_mosaic()
+
+        return image.size[0] * image.size[1] / 1e6, 'megapixels/s'
+
+    def save():
+        mosaic.save(image)
+
+        return image.size[0] * image.size[1] / 1e6, 'megapixels/s'
+
+    for name, stage in zip(STAGES, (get_frames, generate_new_image, create_mosaic, save)):
+        if trace:
+            tracemalloc.start()
+
+        with mosaic.metrics.stage(name) as result:
+            amount, unit = stage()
+
+        del result['name'], result['nested']
+
+        result['seconds'] = result.pop('wall')
+        result['throughput'] = amount / result['seconds'] if result['seconds'] else None
+        result['unit'] = unit
+
+        if trace:
+            result['peak_traced_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        stages[name] = result
+
+    return stages
+
+
+
+def run_end_to_end(
+        tiles: str,
+        target: str,
+        image_max_size: int,
+        frames_size: int,
+        output: str,
+
+        workers: int = 1,
+        pipeline: bool = False
+    ) -> float:
+    '''
+    returns how many seconds `from_folder` takes to create \
+    and save the mosaic of `target` with the frames in `tiles`, \
+    with its steps one after another or, if `pipeline` is set, overlapped
+    '''
+
+    mosaic = MOSAIC(
+        image_path = target,
+        output_file_name = output,
+        sample_image = None,
+        image_max_size = image_max_size,
+        frames_size = frames_size,
+        folder_path = tiles,
+        log = False,
+        clear = False,
+        workers = workers,
+        pipeline = pipeline
+    )
+
+    start = perf_counter()
+
+    mosaic.from_folder()
+
+    return perf_counter() - start
+
+
+
+def run_spread(
+        tiles: str,
+        target: str,
+        image_max_size: int,
+        frames_size: int,
+
+        workers: int = 1
+    ) -> list:
+    '''
+    times `generate_new_image` with `max_uses` on the frames in `tiles` \
+    for 1, 4 and 16 times the cells of `image_max_size` / 4, \
+    with `max_uses` as low as the cells allow, so tiles fill up \
+    and get replaced as often as possible, and returns, for each, \
+    the cells, the `max_uses` and the seconds, which should grow \
+    about as much as the cells do
+    '''
+
+    mosaic = MOSAIC(
+        image_path = target,
+        output_file_name = None,
+        sample_image = None,
+        image_max_size = image_max_size,
+        frames_size = frames_size,
+        folder_path = tiles,
+        log = False,
+        clear = False,
+        workers = workers
+    )
+
+    mosaic.get_frames()
+
+    with Image.open(target) as image:
+        size = image.size
+
+    results = []
+
+    for factor in (1, 2, 4):
+        mosaic.image_max_size = max(1, image_max_size * factor // 4)
+
+        scale = mosaic.image_max_size / max(size)
+        cells = int(size[0] * scale) * int(size[1] * scale)
+
+        mosaic.max_uses = -(-cells // (len(mosaic.result) - 1))
+
+        start = perf_counter()
+
+        mosaic.generate_new_image()
+
+        results.append({
+            'cells': cells,
+            'max_uses': mosaic.max_uses,
+            'seconds': perf_counter() - start
+        })
+
+    return results
+
+
+
+def benchmark(
+        scale: str,
+        data: str,
+        frames_size: int,
+        output_format: str,
+
+        repeat: int = 1,
+        workers: int = 1,
+        memory: bool = True,
+        pipeline: bool = False,
+        spread: bool = False
+    ) -> dict:
+    '''
+    runs `run_stages` `repeat` times on the synthetic data of `scale` \
+    and keeps the best time of each stage, then runs it once more \
+    with `tracemalloc` on, if `memory` is set, for the peak memory, \
+    since tracing slows everything down.
+
+    if `pipeline` is set, it also keeps the best end to end time \
+    of `run_end_to_end`, with and without the pipeline, \
+    and if `spread` is set, the times of `run_spread`
+    '''
+
+    params = SCALES[scale]
+
+    tiles = f'{data}/tiles_{params["tiles"]}'
+    target = f'{data}/target_{params["target"]}.png'
+
+    make_tiles(tiles, params['tiles'])
+    make_target(target, params['target'])
+
+    best = None
+    end_to_end = None
+    spreads = None
+    folder = tempfile.mkdtemp()
+
+    try:
+        for i in range(repeat):
+            stages = run_stages(
+                tiles,
+                target,
+                params['image_max_size'],
+                frames_size,
+                f'{folder}/{i}.{output_format}',
+                workers
+            )
+
+            if best is None:
+                best = stages
+                continue
+
+            for name, result in stages.items():
+                if result['seconds'] < best[name]['seconds']:
+                    best[name].update(seconds = result['seconds'], throughput = result['throughput'])
+
+        if memory:
+            traced = run_stages(
+                tiles,
+                target,
+                params['image_max_size'],
+                frames_size,
+                f'{folder}/traced.{output_format}',
+                workers,
+                True
+            )
+
+            for name, result in traced.items():
+                best[name]['peak_traced_bytes'] = result['peak_traced_bytes']
+
+        if pipeline:
+            times = {
+                name: min(
+                    run_end_to_end(
+                        tiles,
+                        target,
+                        params['image_max_size'],
+                        frames_size,
+                        f'{folder}/{name}_{i}.{output_format}',
+                        workers,
+                        name == 'pipelined'
+                    )
+                    for i in range(repeat)
+                )
+                for name in ('sequential', 'pipelined')
+            }
+
+            end_to_end = {**times, 'speedup': times['sequential'] / times['pipelined']}
+
+        if spread:
+            spreads = run_spread(tiles, target, params['image_max_size'], frames_size, workers)
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
+
+    return {
+        'scale': scale,
+        **params,
+        'frames_size': frames_size,
+        'format': output_format,
+        'workers': workers,
+        'repeat': repeat,
+        'stages': best,
+        'end_to_end': end_to_end,
+        'spread': spreads
+    }
+
+
+
+def environment() -> dict:
+    '''
+    returns the versions and the machine the benchmark ran with
+    '''
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+
+    try:
+        commit = run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd = ROOT,
+            capture_output = True,
+            text = True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'time': strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'pillow': Image.__version__,
+        'numpy': numpy_version if HAS_NUMPY else None,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+
+def print_results(result: dict) -> None:
+    print(
+        f'{result["scale"]}: {result["tiles"]} tiles, '
+        f'{result["target"]}px target, image_max_size {result["image_max_size"]}'
+    )
+
+    for name, stage in result['stages'].items():
+        memory = stage.get('peak_traced_bytes')
+        memory = f', {memory / 1e6:.1f} MB traced' if memory is not None else ''
+
+        print(
+            f'\t{name:<20}{stage["seconds"]:>10.3f}s'
+            f'{stage["throughput"] or 0:>14.1f} {stage["unit"]}{memory}'
+        )
+
+    if result['end_to_end']:
+        print(
+            f'\t{"sequential":<20}{result["end_to_end"]["sequential"]:>10.3f}s\n'
+            f'\t{"pipelined":<20}{result["end_to_end"]["pipelined"]:>10.3f}s'
+            f'{result["end_to_end"]["speedup"]:>14.2f}x'
+        )
+
+    for spread in result['spread'] or ():
+        print(
+            f'\t{"spread " + str(spread["cells"]):<20}{spread["seconds"]:>10.3f}s'
+            f'{spread["seconds"] / result["spread"][0]["seconds"]:>14.1f}x, '
+            f'max_uses {spread["max_uses"]}'
+        )
+
+
+
+## =============== MAIN =============== ##
+
+
+
+def main() -> None:
+    parser = ArgumentParser(description = __doc__.split('\n\n')[0].replace('\\\n', ''))
+
+    parser.add_argument('--scales', nargs = '+', choices = SCALES, default = ['small', 'medium'])
+    parser.add_argument('--frames-size', type = int, default = 16)
+    parser.add_argument('--format', default = 'png', help = 'format of the saved mosaics')
+    parser.add_argument('--repeat', type = int, default = 1, help = 'runs of each scale, the best is kept')
+    parser.add_argument('--workers', type = int, default = 1, help = 'processes used by get_frames')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the tracemalloc run')
+    parser.add_argument('--pipeline', action = 'store_true', help = 'compare end to end times with pipeline')
+    parser.add_argument('--spread', action = 'store_true', help = 'time max_uses at 1, 4 and 16 times the cells')
+    parser.add_argument('--data', default = os.path.join(ROOT, 'benchmarks', 'data'))
+    parser.add_argument('--output', default = os.path.join(ROOT, 'benchmarks', 'results.json'))
+
+    args = parser.parse_args()
+
+    results = []
+
+    for scale in args.scales:
+        result = benchmark(
+            scale,
+            args.data,
+            args.frames_size,
+            args.format,
+            args.repeat,
+            args.workers,
+            not args.no_memory,
+            args.pipeline,
+            args.spread
+        )
+
+        print_results(result)
+        results.append(result)
+
+    with open(args.output, 'w', encoding = 'utf-8') as f:
+        json.dump({**environment(), 'results': results}, f, indent = 4)
+
+    print(f'results saved in \'{args.output}\'')
+
+
+
+if __name__ == '__main__':
+    main()
@@ -30,14 +30,12 @@ mozaiku.from_youtube(
 
 
 SAMPLE_DOCS = '''
-shortcut for\n
+maps each pixel of the `image_path` image to the closest \
+of the colours of the `sample_image` image, \
+as a photo mosaic with one pixel for each small image would\n
 
 ```py
-mozaiku.from_youtube(
-    frames_size = 1,
-    image_max_size = <size of 'image_path' image>
-    *args
-)
+mozaiku.sample('image.png', 'mapped.png', 'palette.png')
 ```
 '''
 
@@ -49,7 +47,10 @@ doc = '''
 - `image_path`:\n
     - the path of the input image, which will become a mosaic
 - `output_file_name`:\n
-    - the path where the mosaic output will be saved
+    - the path where the mosaic output will be saved. \
+    a `.dzi` path saves it as a Deep Zoom pyramid for web viewers, \
+    with its images in the `_files` folder next to it, \
+    and makes the function return `None`
 - `image_max_size`:\n
     - the number of small images \
 that will be on the longest side of the input image
@@ -71,4 +72,64 @@ that will be on the longest side of the input image
     this can affect the speed of the program
 - `clear`:\n
     - whether temporary files will be deleted or not
+- `workers`:\n
+    - how many processes are used to resize the frames \
+    and to create the mosaic, \
+    `None` uses all cores. on Windows, scripts using more than one \
+    must call the function inside an `if __name__ == '__main__':` block
+- `library`:\n
+    - the folder where resized frames are kept between runs. \
+    later runs with the same source and `frames_size` \
+    reuse them, resizing only new or changed frames, \
+    and don't download the video or extract its frames again
+- `stream`:\n
+    - whether the mosaic is written to `output_file_name` a few rows \
+    of small images at a time, instead of being created whole in memory. \
+    needed for huge mosaics, works only with `png`, `tif`, `tiff` \
+    and `npy` files and makes the function return `None`
+- `pipe`:\n
+    - whether the frames of the video are sent straight from `ffmpeg` \
+    to the program, instead of being saved in a folder first. \
+    not available for `from_folder`
+- `sampling`:\n
+    - which frames of the video are used. `fps` takes `fps` frames \
+    each second, `scene` only those where the scene changes \
+    and `keyframes` only the keyframes of the video, which is the fastest. \
+    not available for `from_folder`
+- `max_frames`:\n
+    - the maximum number of frames used. with `fps` sampling \
+    the frame rate is lowered so they're spread over the whole video. \
+    not available for `from_folder`
+- `metrics`:\n
+    - a `mozaiku.Metrics` where the time, CPU time, memory and counts \
+    of each step are collected, to be read or saved as JSON later
+- `max_uses`:\n
+    - the maximum number of times each small image is used. \
+    cells whose closest image is used up get the next closest one
+- `min_spacing`:\n
+    - how many cells, in any direction, there must be at least \
+    between two copies of the same small image. `1` means \
+    no two equal images touch, not even diagonally
+- `pipeline`:\n
+    - whether independent steps run at the same time: the input image \
+    is resized while the frames are processed and, with `numpy`, \
+    `png`, `tif`, `tiff` and `npy` mosaics are saved a few rows \
+    at a time while the next rows are created. \
+    if `workers` isn't `1`, mosaics are created and saved \
+    by many workers instead, which is faster on more cores
+- `checkpoint`:\n
+    - a folder where each finished step is saved: the video, its frames, \
+    the resized frames, the list of images and, with `stream`, \
+    each band of rows written. running the same function again \
+    with the same parameters after it stopped goes on from there. \
+    with `clear` it's deleted once the mosaic is saved
+- `preview`:\n
+    - whether only a preview is saved, with one pixel of the colour \
+    of its small image for each small image, to check parameters \
+    like `image_max_size` in a moment before creating the mosaic
+- `save_preset`:\n
+    - `fast` or `small`, the zlib level and the options of each format \
+    used to save the mosaic, which override `compression_level`. \
+    PNG and TIFF mosaics are compressed by `workers` threads, \
+    and the log shows how big the file is and how long it took
 '''
\ No newline at end of file
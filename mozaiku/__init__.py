@@ -1,11 +1,13 @@
-from PIL        import Image
+from PIL            import Image
 
-from .mosaic    import MOSAIC
+from .mosaic        import MOSAIC
+from .tile_library  import TileLibrary
+from .metrics       import Metrics
 
-from .utils     import *
-from .__doc     import *
+from .utils         import *
+from .__doc         import *
 
-from .          import utils
+from .              import utils
 
 
 
@@ -14,13 +16,34 @@ __all__ = [
     'from_video',
     'from_folder',
     'rickroll',
+    'sample',
     'MOSAIC',
+    'Metrics',
+    'RenderDaemon',
+    'TileLibrary',
+    'send_job',
 
     'utils'
 ]
 
 
 
+## =============== LAZY IMPORTS =============== ##
+
+
+
+def __getattr__(name):
+    # the daemon needs `http.server`, imported only when it's used
+
+    if name in ('RenderDaemon', 'send_job'):
+        from . import daemon
+
+        return getattr(daemon, name)
+
+    raise AttributeError(f'module \'{__name__}\' has no attribute \'{name}\'')
+
+
+
 ## =============== DOC FUNC =============== ##
 
 
@@ -52,13 +75,27 @@ def from_youtube(
         folder: str = 'frames',
         compression_level: int = 6,
         show_progress_bar: bool = False,
-        replace_transparent: tuple = (0, 0, 0, 0)
+        replace_transparent: tuple = (0, 0, 0, 0),
+        workers: int = 1,
+        library: str = None,
+        stream: bool = False,
+        pipe: bool = False,
+        sampling: str = 'fps',
+        max_frames: int = None,
+        metrics: Metrics = None,
+        max_uses: int = None,
+        min_spacing: int = 0,
+        pipeline: bool = False,
+        checkpoint: str = None,
+        preview: bool = False,
+        save_preset: str = None
     ) -> Image:
 
     mosaic = MOSAIC(
         url = url,
         image_path = image_path,
         output_file_name = output_file_name,
+        sample_image = None,
         image_max_size = image_max_size,
         frames_size = frames_size,
 
@@ -68,7 +105,20 @@ def from_youtube(
         folder = folder,
         compression_level = compression_level,
         show_progress_bar = show_progress_bar,
-        replace_transparent = replace_transparent
+        replace_transparent = replace_transparent,
+        workers = workers,
+        library = library,
+        stream = stream,
+        pipe = pipe,
+        sampling = sampling,
+        max_frames = max_frames,
+        metrics = metrics,
+        max_uses = max_uses,
+        min_spacing = min_spacing,
+        pipeline = pipeline,
+        checkpoint = checkpoint,
+        preview = preview,
+        save_preset = save_preset
     )
 
     return mosaic.from_youtube()
@@ -89,13 +139,27 @@ def from_video(
         folder: str = 'frames',
         compression_level: int = 6,
         show_progress_bar: bool = False,
-        replace_transparent: tuple = (0, 0, 0, 0)
+        replace_transparent: tuple = (0, 0, 0, 0),
+        workers: int = 1,
+        library: str = None,
+        stream: bool = False,
+        pipe: bool = False,
+        sampling: str = 'fps',
+        max_frames: int = None,
+        metrics: Metrics = None,
+        max_uses: int = None,
+        min_spacing: int = 0,
+        pipeline: bool = False,
+        checkpoint: str = None,
+        preview: bool = False,
+        save_preset: str = None
     ) -> Image:
 
     mosaic = MOSAIC(
         video_path = video_path,
         image_path = image_path,
         output_file_name = output_file_name,
+        sample_image = None,
         image_max_size = image_max_size,
         frames_size = frames_size,
 
@@ -105,7 +169,20 @@ def from_video(
         folder = folder,
         compression_level = compression_level,
         show_progress_bar = show_progress_bar,
-        replace_transparent = replace_transparent
+        replace_transparent = replace_transparent,
+        workers = workers,
+        library = library,
+        stream = stream,
+        pipe = pipe,
+        sampling = sampling,
+        max_frames = max_frames,
+        metrics = metrics,
+        max_uses = max_uses,
+        min_spacing = min_spacing,
+        pipeline = pipeline,
+        checkpoint = checkpoint,
+        preview = preview,
+        save_preset = save_preset
     )
 
     return mosaic.from_video()
@@ -126,13 +203,24 @@ def from_folder(
         compression_level: int = 6,
         show_progress_bar: bool = False,
         replace_transparent: tuple = (0, 0, 0, 0),
-        frames_are_already_squares: bool = False
+        frames_are_already_squares: bool = False,
+        workers: int = 1,
+        library: str = None,
+        stream: bool = False,
+        metrics: Metrics = None,
+        max_uses: int = None,
+        min_spacing: int = 0,
+        pipeline: bool = False,
+        checkpoint: str = None,
+        preview: bool = False,
+        save_preset: str = None
     ) -> Image:
 
     mosaic = MOSAIC(
         folder_path = folder_path,
         image_path = image_path,
         output_file_name = output_file_name,
+        sample_image = None,
         image_max_size = image_max_size,
         frames_size = frames_size,
 
@@ -141,7 +229,17 @@ def from_folder(
         clear = clear,
         compression_level = compression_level,
         show_progress_bar = show_progress_bar,
-        replace_transparent = replace_transparent
+        replace_transparent = replace_transparent,
+        workers = workers,
+        library = library,
+        stream = stream,
+        metrics = metrics,
+        max_uses = max_uses,
+        min_spacing = min_spacing,
+        pipeline = pipeline,
+        checkpoint = checkpoint,
+        preview = preview,
+        save_preset = save_preset
     )
 
     return mosaic.from_folder(frames_are_already_squares)
@@ -161,13 +259,27 @@ def rickroll(
         folder: str = 'frames',
         compression_level: int = 6,
         show_progress_bar: bool = False,
-        replace_transparent: tuple = (0, 0, 0, 0)
+        replace_transparent: tuple = (0, 0, 0, 0),
+        workers: int = 1,
+        library: str = None,
+        stream: bool = False,
+        pipe: bool = False,
+        sampling: str = 'fps',
+        max_frames: int = None,
+        metrics: Metrics = None,
+        max_uses: int = None,
+        min_spacing: int = 0,
+        pipeline: bool = False,
+        checkpoint: str = None,
+        preview: bool = False,
+        save_preset: str = None
     ) -> Image:
 
     mosaic = MOSAIC(
         url = 'https://youtu.be/dQw4w9WgXcQ',
         image_path = image_path,
         output_file_name = output_file_name,
+        sample_image = None,
         image_max_size = image_max_size,
         frames_size = frames_size,
 
@@ -177,7 +289,20 @@ def rickroll(
         folder = folder,
         compression_level = compression_level,
         show_progress_bar = show_progress_bar,
-        replace_transparent = replace_transparent
+        replace_transparent = replace_transparent,
+        workers = workers,
+        library = library,
+        stream = stream,
+        pipe = pipe,
+        sampling = sampling,
+        max_frames = max_frames,
+        metrics = metrics,
+        max_uses = max_uses,
+        min_spacing = min_spacing,
+        pipeline = pipeline,
+        checkpoint = checkpoint,
+        preview = preview,
+        save_preset = save_preset
     )
 
     return mosaic.from_youtube()
@@ -0,0 +1,461 @@
+from bisect import bisect_left
+from heapq  import heappush, heappop, heapreplace
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'spread_tiles'
+]
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def getter(table):
+    '''
+    returns a function returning `table[row][column]`, \
+    reading it straight from the array if `table` is a numpy array
+    '''
+
+    if hasattr(table, 'item'):
+        return table.item
+
+    return lambda row, column: table[row][column]
+
+
+
+def cell_order(cells: list, first) -> list:
+    '''
+    returns the cells that aren't transparent, sorted by the distance \
+    of their closest tile, so the best matches get their tile first
+    '''
+
+    if hasattr(first, 'tolist'):
+        cells = np.asarray(cells)
+        order = np.argsort(first[cells], kind = 'stable')
+
+        return order[cells[order] >= 0].tolist()
+
+    return sorted(
+        (i for i, colour in enumerate(cells) if colour >= 0),
+        key = lambda i: first[cells[i]]
+    )
+
+
+
+## =============== FREE TILES =============== ##
+
+
+
+class FreeTiles:
+    '''
+    k-d tree over the colours of the tiles of `palette` \
+    that can still be used, like `ColourIndex`, \
+    but tiles are removed from it once they're full.
+
+    each node counts the tiles left under it, so the parts \
+    of the tree that are all full are skipped, and finding \
+    the closest free tiles never goes through the full ones
+    '''
+
+    leaf_size = 8
+
+    def __init__(self, palette, skip: set = ()) -> None:
+        # the nodes from the root to the leaf of each tile
+
+        self.paths = {}
+
+        self.root = self.build(
+            [
+                (*(float(i) for i in colour[:3]), index)
+                for index, colour in enumerate(palette)
+                if index not in skip
+            ],
+            []
+        )
+
+
+
+    def __len__(self) -> int:
+        return self.root[0]
+
+
+
+    def build(self, points: list, path: list) -> list:
+        '''
+        returns a leaf, `[count, points]`, or a node, \
+        `[count, axis, split, left, right]`, see `ColourIndex.build`
+        '''
+
+        spreads = [
+            max(point[axis] for point in points) - min(point[axis] for point in points)
+            for axis in range(3)
+        ] if points else [0]
+
+        axis = spreads.index(max(spreads))
+
+        if len(points) <= self.leaf_size or not spreads[axis]:
+            leaf = [len(points), points]
+
+            for point in points:
+                self.paths[point[3]] = path + [leaf]
+
+            return leaf
+
+        points.sort(key = lambda point: point[axis])
+        middle = len(points) // 2
+
+        node = [len(points), axis, points[middle][axis]]
+        node += [
+            self.build(points[:middle], path + [node]),
+            self.build(points[middle:], path + [node])
+        ]
+
+        return node
+
+
+
+    def remove(self, tile: int) -> None:
+        '''
+        removes `tile`, if it's still there
+        '''
+
+        path = self.paths.pop(tile, None)
+
+        if path is None:
+            return
+
+        points = path[-1][1]
+        points[:] = [point for point in points if point[3] != tile]
+
+        for node in path:
+            node[0] -= 1
+
+
+
+    def query_k(self, colour: tuple, k: int) -> list:
+        '''
+        returns the `(squared distance, tile)` of the `k` closest \
+        free tiles to `colour`, closest first
+        '''
+
+        target = [float(i) for i in colour[:3]]
+        red, green, blue = target
+
+        # max heap of the best `k` so far, the worst is on top
+
+        best = []
+        stack = [(self.root, 0)]
+
+        while stack:
+            node, bound = stack.pop()
+
+            if not node[0] or (len(best) == k and bound > -best[0][0]):
+                continue
+
+            while len(node) == 5:
+                _, axis, split, left, right = node
+                diff = target[axis] - split
+
+                if diff < 0:
+                    stack.append((right, diff * diff))
+                    node = left
+                else:
+                    stack.append((left, diff * diff))
+                    node = right
+
+            for r, g, b, tile in node[1]:
+                item = (-((r - red) ** 2 + (g - green) ** 2 + (b - blue) ** 2), -tile)
+
+                if len(best) < k:
+                    heappush(best, item)
+                elif item > best[0]:
+                    heapreplace(best, item)
+
+        return sorted((-diff, -tile) for diff, tile in best)
+
+
+
+## =============== SPREAD TILES =============== ##
+
+
+
+def spread_tiles(
+        cells: list,
+        columns: int,
+        candidates,
+        distances,
+        tiles: int,
+
+        max_uses: int = None,
+        min_spacing: int = 0,
+        palette = None,
+        colours = None
+    ) -> tuple:
+    '''
+    returns the tile of each of the `cells`, given in rows of `columns`, \
+    so that no tile is used more than `max_uses` times and no tile \
+    is repeated less than `min_spacing` cells away, in any direction, \
+    then how many times a tile was rejected and how many cells \
+    got a tile breaking the rules.
+
+    each cell holds the index of its colour in `candidates` and `distances`, \
+    the indices of the closest `k` of the `tiles` to each colour, \
+    closest first, and their distances, like those from `closest_k_indices`, \
+    or `-1` if it's transparent, and gets `-1` as its tile.
+
+    cells are visited from the best matched one, and a cell whose tile \
+    is taken gets back in line, with a heap, with the distance \
+    of its next candidate, so each cell costs `O(log n)` \
+    for each candidate it tries.
+
+    tiles used `max_uses` times are removed from the candidates \
+    of a colour as soon as they're found there, so they're skipped \
+    only once for each colour, not once for each cell.
+
+    nearby uses of a tile are kept in a `dict` of square buckets \
+    of `min_spacing + 1` cells, so checking the spacing takes \
+    no more than 9 lookups.
+
+    a colour that runs out of candidates gets the closest `k` tiles \
+    that aren't full, from a `FreeTiles` tree over `palette`, \
+    the colours of the tiles, given `colours`, those of the cells, \
+    and twice as many each time they're all too close to the cell, \
+    so a refill costs about as much as the candidates it returns, \
+    however many tiles there are or are full. \
+    once there are no more, the cell gets the first of its `k` candidates \
+    that is far enough from the same tile, ignoring `max_uses`, \
+    or the first one
+    '''
+
+    k = len(candidates[0]) if len(candidates) else 0
+    first = distances[:, 0] if hasattr(distances, 'tolist') else [i[0] for i in distances]
+
+    order = cell_order(cells, first)
+
+    if hasattr(first, 'tolist'):
+        first = first.tolist()
+
+    uses = [0] * tiles
+    max_uses = max_uses or len(cells)
+
+    # tiles used `max_uses` times
+
+    full = set()
+
+    # the candidates left of each colour, as a list of tiles
+    # and one of distances
+
+    lists = {}
+
+    candidate = getter(candidates)
+
+    def row(table, colour: int) -> list:
+        values = table[colour]
+
+        return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+    def options(colour: int) -> tuple:
+        if colour not in lists:
+            lists[colour] = row(candidates, colour), row(distances, colour)
+
+        return lists[colour]
+
+    # made the first time a colour runs out of candidates
+
+    free = None
+
+    def refill(colour: int, size: int) -> bool:
+        '''
+        replaces the candidates of `colour` with the closest `size` \
+        tiles that aren't full, and returns whether there were more \
+        than `size`, or `None` if there are none
+        '''
+
+        nonlocal free
+
+        if palette is None:
+            return None
+
+        if free is None:
+            free = FreeTiles(palette, full)
+
+        if not len(free):
+            return None
+
+        nearest = free.query_k(colours[colour], size)
+
+        lists[colour] = [tile for _, tile in nearest], [diff for diff, _ in nearest]
+
+        return len(free) > size
+
+    # the bucket grid has a border, so that the buckets around
+    # the first and last ones never belong to another tile
+
+    rows = -(-len(cells) // columns)
+    bucket = min_spacing + 1
+
+    bucket_columns = -(-columns // bucket) + 2
+    bucket_rows = -(-rows // bucket) + 2
+
+    neighbours = [
+        row * bucket_columns + column
+        for row in (-1, 0, 1)
+        for column in (-1, 0, 1)
+    ]
+
+    # every cell each tile was placed in, by bucket, even those
+    # placed breaking the rules, which later cells still have to avoid
+
+    placed = {}
+
+    def key(tile: int, cell: int) -> int:
+        row, column = divmod(cell, columns)
+
+        return (tile * bucket_rows + row // bucket + 1) * bucket_columns + column // bucket + 1
+
+    def spaced(tile: int, cell: int) -> bool:
+        if not min_spacing:
+            return True
+
+        row, column = divmod(cell, columns)
+        bucket_key = (tile * bucket_rows + row // bucket + 1) * bucket_columns + column // bucket + 1
+
+        for offset in neighbours:
+            for other in placed.get(bucket_key + offset, ()):
+                other_row, other_column = divmod(other, columns)
+
+                if abs(other_row - row) <= min_spacing and abs(other_column - column) <= min_spacing:
+                    return False
+
+        return True
+
+    def place(tile: int, cell: int) -> None:
+        result[cell] = tile
+        uses[tile] += 1
+
+        if uses[tile] >= max_uses:
+            full.add(tile)
+
+            if free is not None:
+                free.remove(tile)
+
+        if min_spacing:
+            placed.setdefault(key(tile, cell), []).append(cell)
+
+    def prune(tile_list: list, distance_list: list, index: int) -> None:
+        # removes the full tiles from `index` on, until one isn't
+
+        while index < len(tile_list) and tile_list[index] in full:
+            del tile_list[index]
+            del distance_list[index]
+
+    result = [-1] * len(cells)
+
+    retries = 0
+    relaxed = 0
+
+    heap = []
+    position = 0
+
+    while position < len(order) or heap:
+        if heap and (position == len(order) or heap[0][0] < first[cells[order[position]]]):
+            last, cell = heappop(heap)
+        else:
+            cell = order[position]
+            last = float('-inf')
+            position += 1
+
+        colour = cells[cell]
+
+        # most cells get their closest tile, so the lists of candidates
+        # are made only for the colours that need more
+
+        if colour not in lists and last == float('-inf'):
+            tile = candidate(colour, 0)
+
+            if tile not in full and spaced(tile, cell):
+                place(tile, cell)
+                continue
+
+        tile_list, distance_list = options(colour)
+
+        # candidates may have been removed or added since
+        # the cell got in line, so its place is found again
+
+        index = bisect_left(distance_list, last)
+        waiting = False
+
+        # how many tiles the next refill asks for, and whether
+        # there are more than that
+
+        size = max(k, 1)
+        more = True
+
+        while True:
+            prune(tile_list, distance_list, index)
+
+            if index == len(tile_list):
+                if not more:
+                    break
+
+                more = refill(colour, size)
+
+                if more is None:
+                    break
+
+                tile_list, distance_list = lists[colour]
+                index = bisect_left(distance_list, last)
+                size *= 2
+
+                continue
+
+            tile = tile_list[index]
+
+            if spaced(tile, cell):
+                place(tile, cell)
+                break
+
+            retries += 1
+
+            last = distance_list[index]
+            index += 1
+
+            prune(tile_list, distance_list, index)
+
+            if index == len(tile_list):
+                continue
+
+            # the next candidate is tried right away
+            # only if no other cell in line has a closer one
+
+            next_distance = distance_list[index]
+
+            if (heap and heap[0][0] < next_distance) or (
+                position < len(order) and first[cells[order[position]]] < next_distance
+            ):
+                heappush(heap, (next_distance, cell))
+                waiting = True
+                break
+
+        if result[cell] >= 0 or waiting:
+            continue
+
+        # out of candidates, the spacing matters more than the uses
+
+        relaxed += 1
+
+        original = row(candidates, colour)
+
+        tile = next((i for i in original if spaced(i, cell)), original[0])
+
+        place(tile, cell)
+
+    return result, retries, relaxed
@@ -0,0 +1,126 @@
+from PIL    import Image
+
+import mmap
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'TileAtlas'
+]
+
+
+
+## =============== TILE ATLAS =============== ##
+
+
+
+class TileAtlas:
+    '''
+    all the resized tiles in a single contiguous buffer of raw pixels, \
+    that is a uint8 array of shape `(n, size, size, channels)`.
+
+    `rows` maps each key of `MOSAIC.result` to its tile in the buffer, \
+    which is a `bytearray` while tiles are being added, \
+    or a read-only memory map of the `atlas.bin` file of a `LibraryIndex`
+    '''
+
+    def __init__(
+            self,
+            size: int,
+            mode: str,
+
+            buffer = None,
+            rows: dict = None
+        ) -> None:
+
+        self.size = size
+        self.mode = mode
+        self.channels = len(mode)
+        self.tile_length = size * size * self.channels
+
+        self.buffer = bytearray() if buffer is None else buffer
+        self.rows = {} if rows is None else rows
+
+
+
+    def __len__(self) -> int:
+        return len(self.buffer) // self.tile_length
+
+
+
+    def add(self, key: int, data: bytes) -> None:
+        '''
+        appends the raw pixels `data` of the tile of `key`
+        '''
+
+        self.rows[key] = len(self)
+        self.buffer += data
+
+
+
+    def extend(self, other, keys: dict) -> None:
+        '''
+        appends the tiles of the `other` atlas, `keys` maps \
+        their keys in `other` to their keys in this one.
+
+        a memory-mapped atlas can't grow, its tiles are added \
+        to its file instead, see `LibraryIndex.append`
+        '''
+
+        for key, new_key in keys.items():
+            self.add(new_key, other.tile(key))
+
+
+
+    def tile(self, key: int) -> bytes:
+        '''
+        returns the raw pixels of the tile of `key`
+        '''
+
+        start = self.rows[key] * self.tile_length
+
+        return self.buffer[start:start + self.tile_length]
+
+
+
+    def image(self, key: int) -> Image:
+        '''
+        returns the tile of `key` as a PIL image
+        '''
+
+        return Image.frombytes(self.mode, (self.size, self.size), self.tile(key))
+
+
+
+    def array(self):
+        '''
+        returns the whole atlas as a `(n, size, size, channels)` \
+        numpy array, sharing memory with the buffer
+        '''
+
+        return np.frombuffer(self.buffer, dtype = np.uint8).reshape(
+            -1, self.size, self.size, self.channels
+        )
+
+
+
+    @classmethod
+    def load(cls, path: str, size: int, mode: str, rows: dict):
+        '''
+        memory-maps the atlas saved in the `path` file, \
+        nothing is read until tiles are used
+        '''
+
+        if not os.path.getsize(path):
+            return cls(size, mode, rows = rows)
+
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+        return cls(size, mode, buffer, rows)
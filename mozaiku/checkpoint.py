@@ -0,0 +1,122 @@
+from hashlib    import sha1
+
+import pickle
+import shutil
+import json
+import os
+
+
+
+__all__ = [
+    'Checkpoint'
+]
+
+
+
+## =============== CHECKPOINT =============== ##
+
+
+
+class Checkpoint:
+    '''
+    what a job already did, saved in a subfolder of `root` named \
+    after the `params` of the job, so the same job run again \
+    finds it and skips the steps it finished.
+
+    the steps done are saved in `state.json`, next to the files \
+    they made, like the video or the frames, see `file`
+    '''
+
+    def __init__(self, root: str, params: list) -> None:
+        name = sha1(json.dumps(params).encode()).hexdigest()
+
+        self.path = f'{root}/{name[:16]}'
+        self.state_path = self.path + '/state.json'
+
+        self.state = {}
+
+        os.makedirs(self.path, exist_ok = True)
+
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding = 'utf-8') as f:
+                self.state = json.load(f)
+
+
+
+    def child(self, params: list):
+        '''
+        returns the checkpoint of a later part of the job, \
+        like a render after the frames were got, in a subfolder of this one
+        '''
+
+        return Checkpoint(self.path, params)
+
+
+
+    def file(self, name: str) -> str:
+        '''
+        returns the path of the `name` file or folder of the checkpoint
+        '''
+
+        return f'{self.path}/{name}'
+
+
+
+    def done(self, step: str) -> bool:
+        return step in self.state
+
+
+
+    def get(self, step: str, default = None):
+        return self.state.get(step, default)
+
+
+
+    def set(self, step: str, value = True) -> None:
+        '''
+        saves that `step` is done, with `value`, replacing \
+        `state.json` only once it's written, so it's never half saved
+        '''
+
+        self.state[step] = value
+
+        with open(self.state_path + '.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump(self.state, f, separators = (',', ':'))
+
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+
+
+    def dump(self, step: str, data) -> None:
+        '''
+        saves `data` in the `<step>.pkl` file and marks `step` as done
+        '''
+
+        with open(self.file(step + '.pkl.tmp'), 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(self.file(step + '.pkl.tmp'), self.file(step + '.pkl'))
+
+        self.set(step)
+
+
+
+    def load(self, step: str):
+        '''
+        returns the data saved with `dump` for `step`, or `None`
+        '''
+
+        if not self.done(step) or not os.path.exists(self.file(step + '.pkl')):
+            return None
+
+        with open(self.file(step + '.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+
+
+    def remove(self) -> None:
+        '''
+        deletes the checkpoint and everything in it
+        '''
+
+        shutil.rmtree(self.path, ignore_errors = True)
@@ -0,0 +1,183 @@
+from concurrent.futures import ProcessPoolExecutor
+from PIL                import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+
+__all__ = [
+    'HAS_SHARED_MEMORY',
+    'SharedArray',
+    'compose_image',
+    'render_rows'
+]
+
+
+
+HAS_SHARED_MEMORY = np is not None and shared_memory is not None
+
+# the tiles and the output, in the processes of `compose_image`
+
+shared = None
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def render_rows(cells, tiles, start: int, end: int):
+    '''
+    returns the pixels of the rows of cells from `start` to `end` \
+    of the `(rows, columns)` array `cells`, each the index of its tile \
+    in the `(n, size, size, channels)` array `tiles`, \
+    as a `((end - start) * size, columns * size, channels)` array
+    '''
+
+    band = tiles[cells[start:end]]
+    rows, columns, size, _, channels = band.shape
+
+    return band.transpose(0, 2, 1, 3, 4).reshape(rows * size, columns * size, channels)
+
+
+
+class SharedArray:
+    '''
+    uint8 numpy array of `shape` in shared memory, \
+    that other processes open by `name`, see `spec`
+    '''
+
+    def __init__(self, shape: tuple, name: str = None) -> None:
+        size = 1
+
+        for i in shape:
+            size *= i
+
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(
+            name = name,
+            create = self.owner,
+            size = max(1, size)
+        )
+
+        self.array = np.ndarray(shape, dtype = np.uint8, buffer = self.memory.buf)
+
+
+
+    def spec(self) -> tuple:
+        '''
+        returns the arguments opening this array in another process
+        '''
+
+        return self.array.shape, self.memory.name
+
+
+
+    def close(self) -> None:
+        '''
+        closes the array and, in the process that made it, frees its memory
+        '''
+
+        del self.array
+
+        self.memory.close()
+
+        if self.owner:
+            self.memory.unlink()
+
+
+
+## =============== PARALLEL COMPOSITION =============== ##
+
+
+
+def attach(tiles: tuple, output: tuple) -> None:
+    '''
+    opens the shared tiles and output in a process of `compose_image`
+    '''
+
+    global shared
+
+    shared = SharedArray(*tiles), SharedArray(*output)
+
+
+
+def compose_band(cells, start: int) -> None:
+    '''
+    writes in the shared output the rows of cells `cells`, \
+    the first of which is the row `start` of the mosaic
+    '''
+
+    tiles, output = shared
+    size = tiles.array.shape[1]
+
+    output.array[start * size:(start + len(cells)) * size] = render_rows(
+        cells,
+        tiles.array,
+        0,
+        len(cells)
+    )
+
+
+
+def compose_image(
+        cells,
+        tiles,
+        mode: str,
+
+        workers: int = None,
+        band_rows: int = 16,
+        progress_bar = None
+    ) -> Image:
+    '''
+    returns the mosaic of `cells` and `tiles`, see `render_rows`, \
+    as a `mode` image, composed by `workers` processes, \
+    `None` for all cores, each taking bands of `band_rows` rows of cells.
+
+    tiles and the output are in shared memory, so only the indices \
+    of the cells of each band are sent to the processes, \
+    which write their pixels straight in the output.
+
+    `progress_bar` is updated once for each band
+    '''
+
+    rows, columns = cells.shape
+    _, size, _, channels = tiles.shape
+
+    shared_tiles = SharedArray(tiles.shape)
+    output = SharedArray((rows * size, columns * size, channels))
+
+    try:
+        shared_tiles.array[:] = tiles
+
+        with ProcessPoolExecutor(
+            workers,
+            initializer = attach,
+            initargs = (shared_tiles.spec(), output.spec())
+        ) as executor:
+            bands = [
+                executor.submit(compose_band, cells[start:start + band_rows], start)
+                for start in range(0, rows, band_rows)
+            ]
+
+            for band in bands:
+                band.result()
+
+                if progress_bar:
+                    progress_bar.update()
+
+        # `frombytes` copies the pixels, `fromarray` could keep
+        # a view of the shared memory, which is freed right after
+
+        return Image.frombytes(mode, (columns * size, rows * size), output.array)
+    finally:
+        shared_tiles.close()
+        output.close()
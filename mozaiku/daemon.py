@@ -0,0 +1,611 @@
+from http.server        import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error       import HTTPError
+from urllib.request     import Request, urlopen
+from urllib.parse       import urlsplit, parse_qs
+from collections        import deque
+from threading          import Event, Lock, Thread
+from queue              import Queue, Full
+from time               import perf_counter, time
+
+from .tile_library      import TileLibrary
+from .metrics           import Metrics
+
+import argparse
+import json
+import os
+
+
+
+__all__ = [
+    'RenderDaemon',
+    'send_job'
+]
+
+
+
+# the server is only reachable from this machine, and answers
+# only requests addressed to it by these names
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+LOCAL_NAMES = ('127.0.0.1', 'localhost')
+
+# jobs waiting to be run at most, more are refused until some end
+
+QUEUE_SIZE = 16
+
+# finished jobs whose results can still be read
+
+JOBS_KEPT = 256
+
+# kinds of jobs, `load` adds a library, the others call
+# the method of the same name of a library
+
+KINDS = ('load', 'render', 'preview', 'render_video')
+
+
+
+## =============== DAEMON =============== ##
+
+
+
+class RenderDaemon:
+    '''
+    keeps the `libraries`, a dict of `TileLibrary` by name, in memory \
+    and renders mosaics with them for jobs sent over HTTP \
+    to `127.0.0.1:port`, so each job only matches, creates and saves \
+    its mosaic, without importing the package or getting the frames again.
+
+    ```py
+    library = mozaiku.TileLibrary(20, folder_path = 'frames')
+
+    mozaiku.RenderDaemon({'frames': library}).serve_forever()
+    ```
+
+    and from another process
+
+    ```py
+    mozaiku.send_job({
+        'kind': 'render',
+        'library': 'frames',
+        'image_path': 'image.png',
+        'output_file_name': 'mosaic.png',
+        'image_max_size': 100
+    })
+    ```
+
+    ## Requests
+    requests must be addressed to `localhost` or `127.0.0.1`, \
+    and come from no web page but those of the same machine, \
+    so other sites can't send jobs through a browser.
+
+    - `POST /jobs`:\n
+      - queues the JSON job in the body and returns it with its `id`, \
+      or waits until it ends with `?wait=1`. \
+      `kind` is one of `load`, `render`, `preview` or `render_video`, \
+      `options` are the optional parameters of that method. \
+      `load` jobs add a library, named `name`, with `frames_size`, \
+      `url`, `video_path` or `folder_path` and `options`
+    - `GET /jobs` and `GET /jobs/<id>`:\n
+      - the jobs, with their `status`, `error` and `metrics`. \
+      `result` is the path of the file actually written, \
+      which has a number after its name if `output_file_name` existed
+    - `GET /libraries`:\n
+      - the name, `frames_size` and number of tiles of each library
+
+    ## Optional Parameters
+    - `concurrency`:\n
+      - how many jobs run at once. each one can still use \
+      many cores through its `workers` option
+    - `queue_size`:\n
+      - how many jobs can wait, more are refused with `503`
+    - `log`:\n
+      - whether each request is printed or not
+    '''
+
+    def __init__(
+            self,
+            libraries: dict = None,
+
+            port: int = PORT,
+            concurrency: int = 1,
+            queue_size: int = QUEUE_SIZE,
+            log: bool = False
+        ) -> None:
+
+        if concurrency < 1:
+            print('concurrency should be at least 1')
+            raise ValueError
+
+        self.libraries = dict(libraries or {})
+        self.log = log
+
+        self.jobs = {}
+        self.events = {}
+        self.finished = deque()
+        self.next_id = 1
+        self.lock = Lock()
+
+        # loads write the atlas files of the tile library, so two of them
+        # at once could write the same file
+
+        self.load_lock = Lock()
+
+        self.queue = Queue(queue_size)
+        self.threads = [Thread(target = self.work, daemon = True) for _ in range(concurrency)]
+
+        # only this machine can reach the server
+
+        self.server = ThreadingHTTPServer((HOST, port), Handler)
+        self.server.daemon_threads = True
+        self.server.render_daemon = self
+
+        self.thread = None
+
+
+
+    def __enter__(self):
+        return self.start()
+
+
+
+    def __exit__(self, *args) -> None:
+        self.shutdown()
+
+
+
+    @property
+    def address(self) -> tuple:
+        '''
+        the `(host, port)` the server listens on, \
+        useful with `port = 0`, which picks a free port
+        '''
+
+        return self.server.server_address[:2]
+
+
+
+    def serve_forever(self) -> None:
+        '''
+        runs the jobs and answers requests until `shutdown` is called \
+        from another thread or the process is interrupted
+        '''
+
+        for thread in self.threads:
+            thread.start()
+
+        if self.log:
+            print('Serving on http://{}:{}'.format(*self.address))
+
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_workers()
+
+
+
+    def start(self):
+        '''
+        same as `serve_forever`, but in a thread, and returns the daemon
+        '''
+
+        self.thread = Thread(target = self.serve_forever, daemon = True)
+        self.thread.start()
+
+        return self
+
+
+
+    def shutdown(self) -> None:
+        '''
+        stops the server, waits for the running jobs and closes the socket. \
+        jobs still in the queue are dropped
+        '''
+
+        self.server.shutdown()
+
+        if self.thread:
+            self.thread.join()
+
+        self.server.server_close()
+
+
+
+    def stop_workers(self) -> None:
+        '''
+        drops the queued jobs and waits for the running ones to end
+        '''
+
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+        for _ in self.threads:
+            self.queue.put(None)
+
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join()
+
+
+
+    ## ============= JOBS ============= ##
+
+
+
+    def submit(self, job: dict) -> dict:
+        '''
+        queues `job` and returns its record, see `get`. \
+        raises `queue.Full` if `queue_size` jobs are already waiting
+        '''
+
+        if not isinstance(job, dict) or job.get('kind', 'render') not in KINDS:
+            raise ValueError('kind should be one of ' + ', '.join(KINDS))
+
+        with self.lock:
+            job_id = str(self.next_id)
+
+            record = {
+                'id': job_id,
+                'kind': job.get('kind', 'render'),
+                'status': 'queued',
+                'submitted': time(),
+                'seconds': None,
+                'result': None,
+                'error': None,
+                'metrics': None
+            }
+
+            try:
+                self.queue.put_nowait((record, job))
+            except Full:
+                raise Full(f'{self.queue.maxsize} jobs are already waiting') from None
+
+            self.next_id += 1
+            self.jobs[job_id] = record
+            self.events[job_id] = Event()
+
+            return dict(record)
+
+
+
+    def get(self, job_id: str) -> dict:
+        '''
+        returns a copy of the record of the `job_id` job, or `None`. \
+        `status` is `queued`, `running`, `done` or `failed`, \
+        `result` and `metrics` are set once it's done, `error` if it failed
+        '''
+
+        with self.lock:
+            record = self.jobs.get(job_id)
+
+            return dict(record) if record else None
+
+
+
+    def wait(self, job_id: str, timeout: float = None) -> dict:
+        '''
+        waits until the `job_id` job ends and returns its record
+        '''
+
+        event = self.events.get(job_id)
+
+        if event:
+            event.wait(timeout)
+
+        return self.get(job_id)
+
+
+
+    def work(self) -> None:
+        '''
+        runs jobs from the queue, in one of the threads of the daemon
+        '''
+
+        while True:
+            item = self.queue.get()
+
+            if item is None:
+                return
+
+            record, job = item
+
+            with self.lock:
+                record['status'] = 'running'
+
+            start = perf_counter()
+
+            try:
+                result, metrics = self.run(job)
+
+                update = {'status': 'done', 'result': result, 'metrics': metrics}
+            except Exception as e:
+                update = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+            update['seconds'] = perf_counter() - start
+
+            with self.lock:
+                record.update(update)
+
+                self.finished.append(record['id'])
+
+                # old results are forgotten, so the daemon
+                # doesn't grow with each job
+
+                while len(self.finished) > JOBS_KEPT:
+                    old = self.finished.popleft()
+
+                    del self.jobs[old]
+                    del self.events[old]
+
+                self.events[record['id']].set()
+
+
+
+    def run(self, job: dict) -> tuple:
+        '''
+        runs `job` and returns its result and its metrics
+        '''
+
+        kind = job.get('kind', 'render')
+        options = dict(job.get('options') or {})
+
+        if kind == 'load':
+            with self.load_lock:
+                library = TileLibrary(
+                    job['frames_size'],
+                    job.get('url'),
+                    job.get('video_path'),
+                    job.get('folder_path'),
+                    **options
+                )
+
+            # renders already running keep the library they had,
+            # the tile library writes a new atlas file instead of changing
+            # the one they have mapped, see `LibraryIndex.update`
+
+            with self.lock:
+                self.libraries[job['name']] = library
+
+            return {'tiles': len(library)}, library.metrics.as_dict()
+
+        with self.lock:
+            library = self.libraries.get(job.get('library'))
+
+        if library is None:
+            raise KeyError(f'no library named \'{job.get("library")}\'')
+
+        metrics = options['metrics'] = Metrics()
+        threshold = options.pop('threshold', 8)
+
+        # the same steps as the methods of `TileLibrary`, keeping the mosaic
+        # to know which file it wrote, see `MOSAIC.get_output_file_name`
+
+        mosaic = library.get_mosaic(
+            job['video_path' if kind == 'render_video' else 'image_path'],
+            job['output_file_name'],
+            job['image_max_size'],
+            options
+        )
+
+        if kind == 'render_video':
+            mosaic.render_video(threshold)
+        else:
+            mosaic.check_output()
+
+            if kind == 'render':
+                mosaic.render()
+            else:
+                mosaic.save(mosaic.create_preview())
+
+        return mosaic.output_path, metrics.as_dict()
+
+
+
+    def library_info(self) -> dict:
+        '''
+        returns the `frames_size` and the number of tiles of each library
+        '''
+
+        with self.lock:
+            libraries = dict(self.libraries)
+
+        return {
+            name: {'frames_size': library.mosaic.frames_size, 'tiles': len(library)}
+            for name, library in libraries.items()
+        }
+
+
+
+## =============== HTTP =============== ##
+
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    answers the requests of a `RenderDaemon`, in a thread for each one
+    '''
+
+    def do_GET(self) -> None:
+        if not self.is_local():
+            return
+
+        daemon = self.server.render_daemon
+        parts = urlsplit(self.path).path.strip('/').split('/')
+
+        if parts == ['libraries']:
+            return self.reply(200, daemon.library_info())
+
+        if parts == ['jobs']:
+            with daemon.lock:
+                ids = list(daemon.jobs)
+
+            return self.reply(200, [daemon.get(i) for i in ids])
+
+        if len(parts) == 2 and parts[0] == 'jobs':
+            record = daemon.get(parts[1])
+
+            if record:
+                return self.reply(200, record)
+
+        self.reply(404, {'error': f'not found: {self.path}'})
+
+
+
+    def do_POST(self) -> None:
+        daemon = self.server.render_daemon
+        url = urlsplit(self.path)
+
+        if not self.is_local():
+            return
+
+        if url.path.strip('/') != 'jobs':
+            return self.reply(404, {'error': f'not found: {self.path}'})
+
+        # browsers send other content types to other sites without asking,
+        # `application/json` needs the server to allow it, which it never does
+
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+        if content_type != 'application/json':
+            return self.reply(415, {'error': 'Content-Type should be application/json'})
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            record = daemon.submit(json.loads(self.rfile.read(length) or b'{}'))
+        except ValueError as e:
+            return self.reply(400, {'error': str(e)})
+        except Full as e:
+            return self.reply(503, {'error': str(e)})
+
+        if parse_qs(url.query).get('wait', ['0'])[0] not in ('0', 'false'):
+            return self.reply(200, daemon.wait(record['id']))
+
+        self.reply(202, record)
+
+
+
+    def is_local(self) -> bool:
+        '''
+        returns whether the request is addressed to this machine \
+        and comes from no page of another site, otherwise refuses it.
+
+        checking `Host` stops pages of other sites that resolve \
+        their own name to `127.0.0.1` from reading the answers
+        '''
+
+        host = urlsplit('//' + self.headers.get('Host', '')).hostname
+        origin = self.headers.get('Origin')
+
+        if host not in LOCAL_NAMES:
+            self.reply(403, {'error': 'Host should be localhost or 127.0.0.1'})
+            return False
+
+        if origin is not None and urlsplit(origin).hostname not in LOCAL_NAMES:
+            self.reply(403, {'error': 'requests from other sites are not allowed'})
+            return False
+
+        return True
+
+
+
+    def reply(self, status: int, data) -> None:
+        body = json.dumps(data).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.render_daemon.log:
+            super().log_message(format, *args)
+
+
+
+## =============== CLIENT =============== ##
+
+
+
+def send_job(
+        job: dict,
+
+        wait: bool = True,
+        port: int = PORT
+    ) -> dict:
+    '''
+    sends `job` to the `RenderDaemon` on `port` of this machine \
+    and returns its record, once it ends if `wait` is set, \
+    see `RenderDaemon.get`
+    '''
+
+    request = Request(
+        f'http://{HOST}:{port}/jobs' + ('?wait=1' if wait else ''),
+        json.dumps(job).encode(),
+        {'Content-Type': 'application/json'}
+    )
+
+    try:
+        with urlopen(request) as response:
+            return json.load(response)
+    except HTTPError as e:
+        print(json.load(e).get('error', e.reason))
+        raise
+
+
+
+## =============== COMMAND LINE =============== ##
+
+
+
+def main(args: list = None) -> None:
+    '''
+    `python -m mozaiku.daemon --library NAME SOURCE FRAMES_SIZE`, \
+    where `SOURCE` is a YouTube url, a video or a folder of frames
+    '''
+
+    parser = argparse.ArgumentParser(
+        prog = 'python -m mozaiku.daemon',
+        description = 'Keep tile libraries in memory and render mosaics for local jobs.'
+    )
+
+    parser.add_argument(
+        '--library', nargs = 3, action = 'append', default = [],
+        metavar = ('NAME', 'SOURCE', 'FRAMES_SIZE'),
+        help = 'a library to load before serving, a YouTube url, a video or a folder'
+    )
+    parser.add_argument('--port', type = int, default = PORT)
+    parser.add_argument('--concurrency', type = int, default = 1)
+    parser.add_argument('--queue-size', type = int, default = QUEUE_SIZE)
+    parser.add_argument('--workers', type = int, default = 1, help = 'workers of each library')
+
+    args = parser.parse_args(args)
+    libraries = {}
+
+    for name, source, frames_size in args.library:
+        if source.startswith(('http://', 'https://')):
+            key = 'url'
+        elif os.path.isdir(source):
+            key = 'folder_path'
+        else:
+            key = 'video_path'
+
+        libraries[name] = TileLibrary(int(frames_size), workers = args.workers, **{key: source})
+
+    RenderDaemon(
+        libraries,
+        args.port,
+        args.concurrency,
+        args.queue_size,
+        log = True
+    ).serve_forever()
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .writers           import *
+
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'ENCODE_PRESETS',
+    'save_image'
+]
+
+
+
+# Pillow names of the formats of some extensions
+
+FORMATS = {
+    'jpg': 'jpeg',
+    'jpe': 'jpeg',
+    'tif': 'tiff'
+}
+
+# zlib level and Pillow options of each preset, for each format
+
+ENCODE_PRESETS = {
+    'fast': {
+        'level': 1,
+        'jpeg': {'quality': 90, 'subsampling': 2},
+        'webp': {'quality': 90, 'method': 0}
+    },
+    'small': {
+        'level': 9,
+        'png': {'optimize': True},
+        'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+        'webp': {'quality': 80, 'method': 6},
+        'tiff': {'compression': 'tiff_adobe_deflate'}
+    }
+}
+
+# deflate looks back at most this many bytes
+
+WINDOW = 1 << 15
+
+# raw bytes each thread compresses at once, at least
+
+BAND_BYTES = 1 << 20
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def adler32_combine(first: int, second: int, length: int) -> int:
+    '''
+    returns the adler32 of two pieces of data, one after the other, \
+    from the adler32 of each, `first` and `second`, \
+    and the `length` of the second, like zlib's `adler32_combine`
+    '''
+
+    base = 65521
+
+    remainder = length % base
+
+    low = first & 0xffff
+    high = (remainder * low) % base
+
+    low = (low + (second & 0xffff) + base - 1) % base
+    high = (high + (first >> 16) + (second >> 16) + base - remainder) % base
+
+    return low | (high << 16)
+
+
+
+def compress_png_band(array, start: int, end: int, level: int) -> tuple:
+    '''
+    returns the rows from `start` to `end` of the `(height, width, channels)` \
+    array as raw deflate data ending on a byte boundary, \
+    their adler32 and the length of their scanlines.
+
+    the last 32KB of the rows before are the dictionary, like in `pigz`, \
+    so the bands together compress about as well as a single stream
+    '''
+
+    channels = array.shape[2]
+    rows = png_rows(array[start:end], channels)
+
+    options = {}
+
+    if start:
+        before = -(-WINDOW // (array.shape[1] * channels + 1))
+        options['zdict'] = png_rows(array[max(0, start - before):start], channels)[-WINDOW:]
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, **options)
+
+    data = compressor.compress(rows) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    return data, zlib.adler32(rows), len(rows)
+
+
+
+## =============== ENCODERS =============== ##
+
+
+
+def save_png(path: str, array, mode: str, level: int = 6, workers: int = None) -> None:
+    '''
+    saves the `(height, width, channels)` array as a PNG image, \
+    compressing bands of rows in `workers` threads at once. \
+    `zlib` releases the GIL, so they really run at the same time
+    '''
+
+    height, width, channels = array.shape
+
+    band_rows = max(1, BAND_BYTES // (width * channels + 1))
+
+    writer = PNGWriter(path, (width, height), mode, level)
+
+    with ThreadPoolExecutor(workers) as executor:
+        bands = executor.map(
+            lambda start: compress_png_band(array, start, start + band_rows, level),
+            range(0, height, band_rows)
+        )
+
+        for data, checksum, length in bands:
+            writer.chunk(b'IDAT', data)
+            writer.checksum = adler32_combine(writer.checksum, checksum, length)
+
+    # the compressor of the writer never had data,
+    # it only ends the deflate data
+
+    writer.close()
+
+
+
+def save_tiff(path: str, array, mode: str, level: int = 6, workers: int = None) -> None:
+    '''
+    same as `save_png`, but saves a TIFF image, \
+    whose strips are compressed on their own
+    '''
+
+    height, width, channels = array.shape
+
+    band_rows = max(1, BAND_BYTES // (width * channels))
+
+    writer = TIFFWriter(path, (width, height), mode, level)
+
+    with ThreadPoolExecutor(workers) as executor:
+        starts = range(0, height, band_rows)
+        strips = executor.map(
+            lambda start: writer.compress(array[start:start + band_rows]),
+            starts
+        )
+
+        for start, data in zip(starts, strips):
+            writer.write_strip(data, min(band_rows, height - start))
+
+    writer.close()
+
+
+
+PARALLEL_ENCODERS = {
+    'png': save_png,
+    'tiff': save_tiff
+}
+
+
+
+def save_image(
+        image,
+        path: str,
+
+        compression_level: int = 6,
+        preset: str = None,
+        workers: int = 1
+    ) -> None:
+    '''
+    saves the PIL `image` as `path`, in the format of its extension.
+
+    ## Optional Parameters
+    - `compression_level`:\n
+      - the zlib level of PNG and TIFF images
+    - `preset`:\n
+      - `fast` or `small`, one of `ENCODE_PRESETS`, which sets \
+      the zlib level and the options of each format
+    - `workers`:\n
+      - how many threads compress PNG and TIFF images, \
+      `None` for all cores. `1` lets Pillow save the image
+    '''
+
+    extension = path.split('.')[-1].lower()
+    image_format = FORMATS.get(extension, extension)
+
+    options = ENCODE_PRESETS.get(preset, {})
+    level = options.get('level', compression_level)
+
+    if (
+        workers != 1 and np is not None
+        and image_format in PARALLEL_ENCODERS
+        and image.mode in PNGWriter.colour_types
+    ):
+        array = np.asarray(image, dtype = np.uint8).reshape(image.size[1], image.size[0], -1)
+
+        return PARALLEL_ENCODERS[image_format](path, array, image.mode, level, workers)
+
+    # `compress_level` is what Pillow reads for PNG files
+
+    image.save(
+        path,
+        compression_level = level,
+        compress_level = level,
+        **options.get(image_format, {})
+    )
@@ -0,0 +1,490 @@
+from concurrent.futures import ProcessPoolExecutor
+from subprocess         import Popen, PIPE, CalledProcessError, run
+from collections        import deque
+from threading          import Event, Thread
+from queue              import Queue, Full, Empty
+from PIL                import Image
+
+
+
+__all__ = [
+    'PIXEL_FORMATS',
+    'SAMPLINGS',
+    'encode_command',
+    'ffmpeg_command',
+    'process_frame',
+    'process_frames',
+    'process_image',
+    'process_raw_frame',
+    'process_stream',
+    'read_frames',
+    'square_filter',
+    'video_duration',
+    'video_info'
+]
+
+
+
+# ways of choosing which frames of a video become tiles, see `ffmpeg_command`
+
+SAMPLINGS = ('fps', 'scene', 'keyframes')
+
+# modes whose average colour `reduce` can take, see `process_image`
+
+REDUCE_MODES = ('L', 'LA', 'RGB', 'RGBA')
+
+# raw pixel formats of `ffmpeg` for the modes of video mosaics
+
+PIXEL_FORMATS = {
+    'RGB': 'rgb24',
+    'RGBA': 'rgba'
+}
+
+
+
+## =============== FRAMES PROCESSING =============== ##
+
+
+
+def process_frame(
+        path: str,
+        frames_size: int,
+        frames_are_already_squares: bool = False,
+        mode: str = 'RGB'
+    ) -> tuple:
+    '''
+    opens the `path` frame and returns `process_image` of it.
+
+    JPEG frames are decoded straight at the smallest scale, \
+    among 1/2, 1/4 and 1/8, whose sides are still at least `frames_size`, \
+    which is a lot faster than decoding them whole and resizing them
+    '''
+
+    with Image.open(path) as image:
+        image.draft(image.mode, (frames_size, frames_size))
+
+        return process_image(image, frames_size, frames_are_already_squares, mode)
+
+
+
+def process_raw_frame(
+        data: bytes,
+        size: tuple,
+        frames_size: int,
+        frames_are_already_squares: bool = False,
+        mode: str = 'RGB'
+    ) -> tuple:
+    '''
+    returns `process_image` of the frame of the given `size` \
+    whose raw rgb pixels are `data`, like those from `read_frames`
+    '''
+
+    return process_image(
+        Image.frombytes('RGB', size, data),
+        frames_size,
+        frames_are_already_squares,
+        mode
+    )
+
+
+
+def process_image(
+        image: Image,
+        frames_size: int,
+        frames_are_already_squares: bool = False,
+        mode: str = 'RGB'
+    ) -> tuple:
+    '''
+    crops the `image` frame to square and resizes it to `frames_size`, \
+    then returns its average colour and its raw pixels in `mode`, \
+    ready to be added to a `TileAtlas`
+
+    ## Optional Parameters
+    - `frames_are_already_squares`:\n
+      - skip the step of cropping the frame to square
+    - `mode`:\n
+      - the mode of the returned pixels
+    '''
+
+    if not frames_are_already_squares:
+        width, height = image.size
+        new = min(width, height)
+
+        left    = (width  - new) / 2
+        top     = (height - new) / 2
+        right   = (width  + new) / 2
+        bottom  = (height + new) / 2
+
+        image = image.crop((left, top, right, bottom))
+
+    if image.size != (frames_size, frames_size):
+        image = image.resize((frames_size, frames_size))
+
+    # the tile is already small, so its exact average is cheap,
+    # `reduce` takes the mean of a box as big as the whole tile
+
+    if image.mode not in REDUCE_MODES:
+        image = image.convert('RGB')
+
+    res = image.reduce(image.size).getpixel((0, 0))
+
+    return res, image.convert(mode).tobytes()
+
+
+
+def process_frames(
+        jobs: list,
+
+        workers: int = 1,
+        chunk_size: int = 16,
+        func = process_frame
+    ):
+    '''
+    calls `func` (`process_frame` by default) with the arguments \
+    of each of `jobs` and yields the results in the same order as `jobs`
+
+    ## Optional Parameters
+    - `workers`:\n
+      - how many processes are used, `None` uses all cores \
+      and `1` processes the frames in the current process
+    - `chunk_size`:\n
+      - how many frames are sent to a process at once
+    - `func`:\n
+      - the function called, it must be defined at the top level \
+      of a module to be sent to other processes
+    '''
+
+    if not jobs:
+        return
+
+    args = list(zip(*jobs))
+
+    if workers == 1:
+        yield from map(func, *args)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(func, *args, chunksize = chunk_size)
+
+
+
+def process_stream(
+        jobs,
+
+        workers: int = 1,
+        buffer_size: int = 64,
+        func = process_raw_frame
+    ):
+    '''
+    same as `process_frames`, but `jobs` can be any iterable, \
+    even an endless one, and no more than `buffer_size` jobs \
+    are waiting for their results at the same time
+    '''
+
+    if workers == 1:
+        for job in jobs:
+            yield func(*job)
+
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+
+        for job in jobs:
+            pending.append(executor.submit(func, *job))
+
+            if len(pending) >= buffer_size:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+
+## =============== FFMPEG =============== ##
+
+
+
+def square_filter(frames_size: int) -> str:
+    '''
+    returns the `ffmpeg` filter graph that crops each frame \
+    to a centered square and resizes it to `frames_size`, \
+    like `process_image` does
+    '''
+
+    return f"crop='min(iw,ih)':'min(iw,ih)',scale={frames_size}:{frames_size}:flags=area"
+
+
+
+def video_duration(video_path: str) -> float:
+    '''
+    returns the duration in seconds of the `video_path` video \
+    using `ffprobe`, or `None` if it's unknown
+    '''
+
+    output = run(
+        [
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration',
+            '-of', 'csv=p=0',
+            video_path
+        ],
+        check = True,
+        capture_output = True,
+        text = True
+    ).stdout
+
+    try:
+        return float(output)
+    except ValueError:
+        return None
+
+
+
+def video_info(video_path: str) -> tuple:
+    '''
+    returns the `(width, height, frame_rate)` of the first video stream \
+    of the `video_path` video using `ffprobe`, \
+    the frame rate is a string like `30000/1001`
+    '''
+
+    output = run(
+        [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,r_frame_rate',
+            '-of', 'csv=p=0',
+            video_path
+        ],
+        check = True,
+        capture_output = True,
+        text = True
+    ).stdout
+
+    width, height, frame_rate = output.strip().split(',')[:3]
+
+    return int(width), int(height), frame_rate
+
+
+
+def ffmpeg_command(
+        video_path: str,
+        output: list,
+        frames_size: int,
+        fps: int,
+
+        sampling: str = 'fps',
+        scene_threshold: float = 0.3,
+        max_frames: int = None,
+        log: bool = False
+    ) -> list:
+    '''
+    returns the `ffmpeg` command extracting frames from the `video_path` \
+    video, cropped and resized by `square_filter`, \
+    to `output`, the output arguments
+
+    ## Optional Parameters
+    - `sampling`:\n
+      - `fps`: `fps` frames for each second of the video
+      - `scene`: only frames that differ from the previous one \
+      more than `scene_threshold`, between `0` and `1`
+      - `keyframes`: only keyframes, the other frames \
+      are not even decoded
+    - `max_frames`:\n
+      - the maximum number of frames, spread over the whole video: \
+      with `fps` sampling the frame rate is lowered, otherwise \
+      frames closer than `duration / max_frames` seconds \
+      to the last one taken are skipped
+    - `log`:\n
+      - whether `ffmpeg` prints its stats or not
+    '''
+
+    input_args = []
+    output_args = ['-vsync', 'vfr']
+    filters = [square_filter(frames_size)]
+
+    duration = video_duration(video_path) if max_frames else None
+
+    if sampling == 'fps':
+        rate = fps
+
+        if duration:
+            rate = min(fps, max_frames / duration)
+
+        output_args = ['-r', str(rate)]
+    else:
+        conditions = []
+
+        if sampling == 'keyframes':
+            input_args = ['-skip_frame', 'nokey']
+        else:
+            conditions.append(f'gt(scene,{scene_threshold})')
+
+        # stopping after the first `max_frames` frames would take them all
+        # from the start of the video, so they're kept apart instead
+
+        if duration:
+            gap = duration / max_frames
+
+            conditions.append(f'(isnan(prev_selected_t)+gte(t-prev_selected_t,{gap}))')
+
+        if conditions:
+            filters.insert(0, "select='{}'".format('*'.join(conditions)))
+
+    # still a limit, in case the duration is wrong
+
+    if max_frames:
+        output_args += ['-frames:v', str(max_frames)]
+
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        *(['-stats'] if log else []),
+        *input_args,
+        '-i', video_path,
+        *output_args,
+        '-vf', ','.join(filters),
+        *output
+    ]
+
+
+
+def encode_command(
+        output_path: str,
+        size: tuple,
+        mode: str,
+        frame_rate: str,
+
+        audio_path: str = None,
+        log: bool = False
+    ) -> list:
+    '''
+    returns the `ffmpeg` command encoding the raw pixels in `mode` \
+    of frames of the given `size`, sent to its standard input, \
+    in the `output_path` video at `frame_rate` frames per second
+
+    ## Optional Parameters
+    - `audio_path`:\n
+      - a video whose audio, if any, is added to the output
+    - `log`:\n
+      - whether `ffmpeg` prints its stats or not
+    '''
+
+    extension = output_path.split('.')[-1].lower()
+
+    input_args = [
+        '-f', 'rawvideo',
+        '-pix_fmt', PIXEL_FORMATS[mode],
+        '-s', f'{size[0]}x{size[1]}',
+        '-framerate', str(frame_rate),
+        '-i', '-'
+    ]
+
+    output_args = []
+
+    if audio_path and extension != 'gif':
+        input_args += ['-i', audio_path]
+        output_args += ['-map', '0:v', '-map', '1:a?']
+
+    # most players only play yuv420p, which needs an even width and height
+
+    if extension in ('mp4', 'm4v', 'mov', 'mkv'):
+        output_args += [
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            '-pix_fmt', 'yuv420p'
+        ]
+
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        *(['-stats'] if log else []),
+        *input_args,
+        *output_args,
+        output_path
+    ]
+
+
+
+def read_frames(
+        command: list,
+        size: tuple,
+
+        buffer_size: int = 64
+    ):
+    '''
+    yields the raw rgb pixels of the frames of the given `size` \
+    decoded by `command`, an `ffmpeg` command without its output, \
+    like an `ffmpeg_command`, sent through a pipe, \
+    so nothing is written on disk.
+
+    a thread reads the pipe while frames are being used, \
+    keeping at most `buffer_size` of them in memory
+    '''
+
+    frame_length = size[0] * size[1] * 3
+
+    process = Popen(
+        command + ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'],
+        stdout = PIPE
+    )
+
+    frames = Queue(buffer_size)
+    stopped = Event()
+
+    def put(data) -> bool:
+        # waits for room in the queue, unless the generator was closed,
+        # otherwise the thread could wait forever on a full queue
+
+        while not stopped.is_set():
+            try:
+                frames.put(data, timeout = 0.1)
+                return True
+            except Full:
+                pass
+
+        return False
+
+    def reader():
+        while True:
+            data = process.stdout.read(frame_length)
+
+            if len(data) < frame_length:
+                put(None)
+                return
+
+            if not put(data):
+                return
+
+    thread = Thread(target = reader, daemon = True)
+    thread.start()
+
+    finished = False
+
+    try:
+        data = frames.get()
+
+        while data is not None:
+            yield data
+            data = frames.get()
+
+        finished = True
+    finally:
+        # the generator was closed before the end of the video
+
+        if not finished:
+            stopped.set()
+            process.kill()
+
+        # frames still in the queue are freed and the thread ends
+
+        while True:
+            try:
+                frames.get_nowait()
+            except Empty:
+                break
+
+        thread.join()
+
+        process.wait()
+        process.stdout.close()
+
+    if process.returncode:
+        raise CalledProcessError(process.returncode, process.args)
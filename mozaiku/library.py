@@ -0,0 +1,425 @@
+from hashlib    import sha1
+
+from .frames    import *
+from .atlas     import *
+
+import shutil
+import json
+import os
+
+
+
+__all__ = [
+    'LibraryIndex',
+    'file_hash'
+]
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def file_hash(path: str) -> str:
+    '''
+    returns the sha1 hex digest of the content of the `path` file
+    '''
+
+    digest = sha1()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+
+def ingest_frame(
+        path: str,
+        frames_size: int,
+        frames_are_already_squares: bool,
+        mode: str
+    ) -> tuple:
+    '''
+    same as `process_frame`, but returns also the hash of the `path` file
+    '''
+
+    return (file_hash(path), *process_frame(
+        path,
+        frames_size,
+        frames_are_already_squares,
+        mode
+    ))
+
+
+
+## =============== LIBRARY INDEX =============== ##
+
+
+
+class LibraryIndex:
+    '''
+    persistent index of the tiles made from a `source`, which is \
+    a folder of images, a video or a YouTube url.
+
+    it's saved in `index.json` in a subfolder of `root` named after \
+    the source and the parameters used to make the tiles, \
+    next to `atlas.bin`, the `TileAtlas` holding the tiles, \
+    so a later run with the same parameters finds it \
+    and reprocesses only the frames that changed.
+
+    each frame is saved as\n
+    `name: [key, mtime_ns, size, hash, colour, row]`\n
+    and each tile added from another source with `append` as\n
+    `[key, colour, row]`
+    '''
+
+    version = 4
+
+    def __init__(
+            self,
+            root: str,
+            source: str,
+            frames_size: int,
+
+            frames_are_already_squares: bool = False,
+            fps: int = None,
+            mode: str = 'RGB',
+            sampling: list = None
+        ) -> None:
+
+        self.source = source if '://' in source else os.path.abspath(source)
+        self.params = [frames_size, frames_are_already_squares, fps, mode, sampling]
+
+        name = sha1(json.dumps([self.source, *self.params]).encode()).hexdigest()
+
+        self.path = f'{root}/{name[:16]}'
+        self.atlas_path = self.path + '/atlas.bin'
+        self.index_path = self.path + '/index.json'
+
+        self.tile_length = frames_size * frames_size * len(mode)
+
+        self.stat = None
+        self.next_key = 1
+        self.frames = {}
+        self.appended = []
+
+        os.makedirs(self.path, exist_ok = True)
+
+        self.load()
+
+
+
+    def load(self) -> None:
+        '''
+        loads `index.json` if it exists and was saved by the same version
+        '''
+
+        if not os.path.exists(self.index_path):
+            return
+
+        with open(self.index_path, encoding = 'utf-8') as f:
+            index = json.load(f)
+
+        if index.get('version') != self.version:
+            return
+
+        self.stat = index['stat']
+        self.next_key = index['next_key']
+        self.frames = {
+            name: [*frame[:4], tuple(frame[4]), frame[5]]
+            for name, frame in index['frames'].items()
+        }
+        self.appended = [[key, tuple(colour), row] for key, colour, row in index['appended']]
+
+
+
+    def save(self) -> None:
+        '''
+        saves `index.json`, replacing the old one only once it's written
+        '''
+
+        index = {
+            'version': self.version,
+            'source': self.source,
+            'params': self.params,
+            'stat': self.stat,
+            'next_key': self.next_key,
+            'frames': self.frames,
+            'appended': self.appended
+        }
+
+        with open(self.index_path + '.tmp', 'w', encoding = 'utf-8') as f:
+            json.dump(index, f, separators = (',', ':'))
+
+        os.replace(self.index_path + '.tmp', self.index_path)
+
+
+
+    def source_stat(self) -> list:
+        '''
+        returns the `[mtime_ns, size]` of the source file, \
+        or the url itself for YouTube sources
+        '''
+
+        if '://' in self.source:
+            return self.source
+
+        stat = os.stat(self.source)
+
+        return [stat.st_mtime_ns, stat.st_size]
+
+
+
+    def is_up_to_date(self) -> bool:
+        '''
+        returns whether the source video didn't change since the last \
+        `update`, so its frames don't need to be extracted again
+        '''
+
+        if os.path.isdir(self.source):
+            return False
+
+        return bool(self.frames) and self.stat == self.source_stat()
+
+
+
+    def update(
+            self,
+            folder: str,
+
+            workers: int = 1,
+            chunk_size: int = 16,
+            progress_bar = None
+        ) -> tuple:
+        '''
+        brings the index up to date with the frames in `folder`, \
+        processing only those that are new or whose content changed, \
+        and returns how many were `(added, changed, removed)`.
+
+        frames whose mtime and size didn't change are trusted, \
+        the others are hashed and compared before being reprocessed.
+
+        new frames get new keys in sorted order, \
+        the others keep theirs
+
+        ## Optional Parameters
+        - `workers`, `chunk_size`:\n
+          - see `process_frames`
+        - `progress_bar`:\n
+          - updated once for each frame in `folder`
+        '''
+
+        frames_size, squares, _, mode, _ = self.params
+
+        names = sorted(os.listdir(folder))
+        stats = {}
+
+        for name in names:
+            stat = os.stat(folder + '/' + name)
+            stats[name] = [stat.st_mtime_ns, stat.st_size]
+
+        # rows of removed frames are reused by new ones
+
+        removed = [name for name in self.frames if name not in stats]
+
+        for name in removed:
+            del self.frames[name]
+
+        rows = len(self)
+        free_rows = sorted(
+            set(range(rows))
+            - {frame[5] for frame in self.frames.values()}
+            - {row for _, _, row in self.appended}
+        )
+
+        jobs = []
+        added = changed = 0
+
+        for name in names:
+            path = folder + '/' + name
+            frame = self.frames.get(name)
+
+            if frame and frame[1:3] == stats[name]:
+                continue
+
+            if frame and frame[3] == file_hash(path):
+                frame[1:3] = stats[name]
+                continue
+
+            if frame:
+                key, row = frame[0], frame[5]
+                changed += 1
+            else:
+                key = self.next_key
+                self.next_key += 1
+                added += 1
+
+                if free_rows:
+                    row = free_rows.pop(0)
+                else:
+                    row = rows
+                    rows += 1
+
+            jobs.append((name, key, row, (path, frames_size, squares, mode)))
+
+        if progress_bar:
+            for _ in range(len(names) - len(jobs)):
+                progress_bar.update()
+
+        results = process_frames(
+            [job[3] for job in jobs],
+            workers,
+            chunk_size,
+            ingest_frame
+        )
+
+        # libraries still alive map the old file, so changed rows
+        # are written in a copy, which then replaces it
+
+        if jobs:
+            if os.path.exists(self.atlas_path):
+                shutil.copyfile(self.atlas_path, self.atlas_path + '.tmp')
+            else:
+                open(self.atlas_path + '.tmp', 'wb').close()
+
+            with open(self.atlas_path + '.tmp', 'r+b') as f:
+                for (name, key, row, _), (digest, colour, data) in zip(jobs, results):
+                    f.seek(row * self.tile_length)
+                    f.write(data)
+
+                    self.frames[name] = [key, *stats[name], digest, colour, row]
+
+                    if progress_bar:
+                        progress_bar.update()
+
+            os.replace(self.atlas_path + '.tmp', self.atlas_path)
+
+        self.stat = self.source_stat()
+        self.save()
+
+        return added, changed, len(removed)
+
+
+
+    def rebuild(self, frames, progress_bar = None) -> int:
+        '''
+        replaces all frames with `frames`, the `(colour, raw pixels)` \
+        of each frame of the source video, in order, \
+        and returns how many there were.
+
+        used when frames come straight from `read_frames`, \
+        so there are no files to check.
+
+        tiles added with `append` are kept, after the frames, with new keys
+        '''
+
+        self.frames = {}
+
+        # libraries still alive map the old file, truncating it
+        # under them would crash them, so it's replaced only once written
+
+        with open(self.atlas_path + '.tmp', 'wb') as f:
+            for row, (colour, data) in enumerate(frames):
+                f.write(data)
+
+                self.frames[f'out-{row + 1:06d}'] = [row + 1, None, None, None, colour, row]
+
+                if progress_bar:
+                    progress_bar.update()
+
+            if self.appended:
+                with open(self.atlas_path, 'rb') as old:
+                    for row, tile in enumerate(self.appended, len(self.frames)):
+                        old.seek(tile[2] * self.tile_length)
+                        f.write(old.read(self.tile_length))
+
+                        tile[0], tile[2] = row + 1, row
+
+        os.replace(self.atlas_path + '.tmp', self.atlas_path)
+
+        self.next_key = len(self.frames) + len(self.appended) + 1
+        self.stat = self.source_stat()
+        self.save()
+
+        return len(self.frames)
+
+
+
+    def append(self, tiles: list) -> list:
+        '''
+        adds `tiles`, the `(colour, raw pixels)` of tiles \
+        of another source, at the end of the atlas, \
+        and returns their keys, after those of the frames.
+
+        they aren't frames of the source, so `update` keeps them
+        '''
+
+        keys = []
+
+        # libraries still alive map only the start of the file,
+        # which doesn't change
+
+        with open(self.atlas_path, 'ab') as f:
+            row = f.tell() // self.tile_length
+
+            for colour, data in tiles:
+                f.write(data)
+
+                self.appended.append([self.next_key, colour, row])
+                keys.append(self.next_key)
+
+                self.next_key += 1
+                row += 1
+
+        self.save()
+
+        return keys
+
+
+
+    def __len__(self) -> int:
+        '''
+        returns how many tiles fit in the atlas file, \
+        including those of removed frames
+        '''
+
+        if not os.path.exists(self.atlas_path):
+            return 0
+
+        return os.path.getsize(self.atlas_path) // self.tile_length
+
+
+
+    def tiles(self) -> list:
+        '''
+        returns the `(key, colour)` of each tile, sorted by key
+        '''
+
+        return sorted(
+            [(frame[0], frame[4]) for frame in self.frames.values()]
+            + [(key, colour) for key, colour, _ in self.appended]
+        )
+
+
+
+    def atlas(self) -> TileAtlas:
+        '''
+        returns the memory-mapped `TileAtlas` of the library
+        '''
+
+        frames_size, _, _, mode, _ = self.params
+
+        if not os.path.exists(self.atlas_path):
+            open(self.atlas_path, 'wb').close()
+
+        return TileAtlas.load(
+            self.atlas_path,
+            frames_size,
+            mode,
+            {
+                **{frame[0]: frame[5] for frame in self.frames.values()},
+                **{key: row for key, _, row in self.appended}
+            }
+        )
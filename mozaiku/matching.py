@@ -0,0 +1,639 @@
+from operator   import itemgetter
+from heapq      import heappush, heapreplace
+from time       import perf_counter
+
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'ColourIndex',
+    'ColourLUT',
+    'HAS_NUMPY',
+    'INDEX_THRESHOLD',
+    'closest_chunks',
+    'closest_indices',
+    'closest_k_indices',
+    'unique_colours',
+    'unique_pixels'
+]
+
+
+
+HAS_NUMPY = np is not None
+
+# maximum number of (colour, palette entry) distances computed at once
+
+CHUNK_SIZE = 1 << 22
+
+# palettes with at least this many colours are matched with `ColourIndex`
+# even when numpy is available, brute force gets slower from here on
+
+INDEX_THRESHOLD = 1 << 15
+
+
+
+## =============== VECTORIZED MATCHING =============== ##
+
+
+
+def unique_pixels(image):
+    '''
+    returns the unique pixels of the PIL `image`, as a `(n, channels)` \
+    array, and, for each pixel, the index of its colour in that array
+    '''
+
+    channels = len(image.getbands())
+
+    return unique_colours(np.asarray(image, dtype = np.uint8).reshape(-1, channels))
+
+
+
+def unique_colours(pixels):
+    '''
+    same as `unique_pixels`, but of the `(n, channels)` uint8 array `pixels`
+    '''
+
+    channels = pixels.shape[1]
+
+    # pack every pixel in a single integer, it's way faster than
+    # np.unique(axis = 0), which sorts rows lexicographically
+
+    packed = np.zeros(len(pixels), dtype = np.uint32)
+
+    for i in range(channels):
+        packed |= pixels[:, i].astype(np.uint32) << (8 * i)
+
+    packed, inverse = np.unique(packed, return_inverse = True)
+
+    unique = np.empty((len(packed), channels), dtype = np.uint8)
+
+    for i in range(channels):
+        unique[:, i] = (packed >> (8 * i)) & 255
+
+    return unique, inverse.reshape(-1)
+
+
+
+def closest_indices(
+        palette,
+        colours,
+
+        chunk_size: int = CHUNK_SIZE,
+        progress_bar = None
+    ):
+    '''
+    returns, for each colour in `colours`, the index of the closest \
+    colour in `palette`, comparing only the first three channels.
+
+    ties go to the lowest index, so the result is the same \
+    as calling `MOSAIC.get_closest_colour` on each colour
+
+    ## Optional Parameters
+    - `chunk_size`:\n
+      - how many distances are computed at once
+    - `progress_bar`:\n
+      - updated once for each chunk, see `closest_chunks`
+    '''
+
+    palette = np.asarray(palette, dtype = np.float32).reshape(len(palette), -1)[:, :3]
+    colours = np.asarray(colours, dtype = np.float32).reshape(len(colours), -1)[:, :3]
+
+    # |c - p|² = |c|² - 2 c·p + |p|², and |c|² is the same for the whole row,
+    # so it doesn't change the argmin. every term is an integer smaller
+    # than 2 ** 24, which means float32 (and BLAS) gives exact results
+
+    palette_norms = (palette * palette).sum(axis = 1)
+    palette_t = np.ascontiguousarray(palette.T) * -2
+
+    result = np.empty(len(colours), dtype = np.intp)
+    step = closest_chunks(len(palette), chunk_size)
+
+    for start in range(0, len(colours), step):
+        distances = colours[start:start + step] @ palette_t
+        distances += palette_norms
+
+        result[start:start + step] = distances.argmin(axis = 1)
+
+        if progress_bar:
+            progress_bar.update()
+
+    return result
+
+
+
+def closest_k_indices(
+        palette,
+        colours,
+        k: int,
+
+        chunk_size: int = CHUNK_SIZE
+    ) -> tuple:
+    '''
+    same as `closest_indices`, but returns the indices of the `k` closest \
+    colours in `palette`, closest first, and their squared distances, \
+    as two `(len(colours), k)` arrays. colours as far as the `k`-th \
+    one may be left out in its place
+    '''
+
+    palette = np.asarray(palette, dtype = np.float32).reshape(len(palette), -1)[:, :3]
+    colours = np.asarray(colours, dtype = np.float32).reshape(len(colours), -1)[:, :3]
+
+    k = min(k, len(palette))
+
+    palette_norms = (palette * palette).sum(axis = 1)
+    palette_t = np.ascontiguousarray(palette.T) * -2
+
+    indices = np.empty((len(colours), k), dtype = np.intp)
+    distances = np.empty((len(colours), k), dtype = np.float32)
+
+    step = closest_chunks(len(palette), chunk_size)
+
+    for start in range(0, len(colours), step):
+        chunk = colours[start:start + step]
+
+        chunk_distances = chunk @ palette_t
+        chunk_distances += palette_norms
+        chunk_distances += (chunk * chunk).sum(axis = 1)[:, None]
+
+        if k < len(palette):
+            nearest = np.argpartition(chunk_distances, k - 1, axis = 1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(k), chunk_distances.shape)
+
+        nearest_distances = np.take_along_axis(chunk_distances, nearest, axis = 1)
+
+        # closest first, ties to the lowest index like `closest_indices`
+
+        order = np.lexsort((nearest, nearest_distances), axis = 1)
+
+        indices[start:start + step] = np.take_along_axis(nearest, order, axis = 1)
+        distances[start:start + step] = np.take_along_axis(nearest_distances, order, axis = 1)
+
+    return indices, distances
+
+
+
+def closest_chunks(palette_length: int, chunk_size: int = CHUNK_SIZE) -> int:
+    '''
+    returns how many colours `closest_indices` matches in each chunk
+    '''
+
+    return max(1, chunk_size // max(1, palette_length))
+
+
+
+## =============== NEAREST NEIGHBOUR INDEX =============== ##
+
+
+
+class ColourIndex:
+    '''
+    exact k-d tree over the first three channels of a list of `colours`, \
+    finds the closest colour without scanning the whole list.
+
+    ties go to the lowest index, so the result is always the same \
+    as `MOSAIC.get_closest_colour`.
+
+    `build_time` and `query_time` hold the seconds spent \
+    building the tree and answering the `queries` so far
+    '''
+
+    leaf_size = 8
+
+    def __init__(self, colours: list) -> None:
+        start = perf_counter()
+
+        self.colours = list(colours)
+        self.root = self.build([
+            (*colour[:3], index) for index, colour in enumerate(self.colours)
+        ])
+
+        self.build_time = perf_counter() - start
+        self.query_time = 0
+        self.queries = 0
+
+
+
+    def __len__(self) -> int:
+        return len(self.colours)
+
+
+
+    def build(self, points: list):
+        '''
+        returns a leaf (a list of `(r, g, b, index)` points) or a node, \
+        an `(axis, split, left, right)` tuple splitting `points` \
+        on the median of the channel with the widest range
+        '''
+
+        if len(points) <= self.leaf_size:
+            return points
+
+        spreads = [
+            max(point[axis] for point in points) - min(point[axis] for point in points)
+            for axis in range(3)
+        ]
+
+        axis = spreads.index(max(spreads))
+
+        # all points have the same (r, g, b), it happens only
+        # with colours that differ just in the alpha channel
+
+        if not spreads[axis]:
+            return points
+
+        points.sort(key = itemgetter(axis))
+        middle = len(points) // 2
+
+        return (
+            axis,
+            points[middle][axis],
+            self.build(points[:middle]),
+            self.build(points[middle:])
+        )
+
+
+
+    def add(self, colours: list) -> None:
+        '''
+        appends `colours` to the colours of the index, \
+        inserting them in the tree without building it again
+        '''
+
+        start = perf_counter()
+
+        for colour in colours:
+            self.root = self.insert(self.root, (*colour[:3], len(self.colours)))
+            self.colours.append(colour)
+
+        self.build_time += perf_counter() - start
+
+
+
+    def insert(self, node, point: tuple):
+        '''
+        returns `node` with `point` added to the leaf it belongs to. \
+        leaves twice as big as `leaf_size` are split with `build`, \
+        and the nodes above them are replaced, since they're tuples
+        '''
+
+        if type(node) is not tuple:
+            node.append(point)
+
+            if len(node) > 2 * self.leaf_size:
+                return self.build(node)
+
+            return node
+
+        axis, split, left, right = node
+
+        # same side `query` goes for a colour equal to `point`
+
+        if point[axis] < split:
+            child = self.insert(left, point)
+
+            return node if child is left else (axis, split, child, right)
+
+        child = self.insert(right, point)
+
+        return node if child is right else (axis, split, left, child)
+
+
+
+    def query(self, colour: tuple) -> int:
+        '''
+        returns the index of the closest colour to `colour`
+        '''
+
+        start = perf_counter()
+
+        red, green, blue = target = colour[:3]
+
+        best_diff = 1 << 30
+        best_index = -1
+
+        stack = [(self.root, 0)]
+
+        while stack:
+            node, bound = stack.pop()
+
+            # equal bounds are not skipped, a farther branch
+            # could hold a colour as close as this one with a lower index
+
+            if bound > best_diff:
+                continue
+
+            while type(node) is tuple:
+                axis, split, left, right = node
+                diff = target[axis] - split
+
+                if diff < 0:
+                    stack.append((right, diff * diff))
+                    node = left
+                else:
+                    stack.append((left, diff * diff))
+                    node = right
+
+            for i_red, i_green, i_blue, index in node:
+                diff_1, diff_2, diff_3 = red - i_red, green - i_green, blue - i_blue
+                colour_diff = diff_1 * diff_1 + diff_2 * diff_2 + diff_3 * diff_3
+
+                if colour_diff < best_diff or (
+                    colour_diff == best_diff and index < best_index
+                ):
+                    best_diff = colour_diff
+                    best_index = index
+
+        self.query_time += perf_counter() - start
+        self.queries += 1
+
+        return best_index
+
+
+
+    def query_k(self, colour: tuple, k: int) -> list:
+        '''
+        returns the `(squared distance, index)` of the `k` closest colours \
+        to `colour`, closest first, ties to the lowest index
+        '''
+
+        start = perf_counter()
+
+        red, green, blue = target = colour[:3]
+
+        # max heap of the best `k` so far, the worst is on top
+
+        best = []
+        stack = [(self.root, 0)]
+
+        while stack:
+            node, bound = stack.pop()
+
+            if len(best) == k and bound > -best[0][0]:
+                continue
+
+            while type(node) is tuple:
+                axis, split, left, right = node
+                diff = target[axis] - split
+
+                if diff < 0:
+                    stack.append((right, diff * diff))
+                    node = left
+                else:
+                    stack.append((left, diff * diff))
+                    node = right
+
+            for i_red, i_green, i_blue, index in node:
+                diff_1, diff_2, diff_3 = red - i_red, green - i_green, blue - i_blue
+                item = (-(diff_1 * diff_1 + diff_2 * diff_2 + diff_3 * diff_3), -index)
+
+                if len(best) < k:
+                    heappush(best, item)
+                elif item > best[0]:
+                    heapreplace(best, item)
+
+        self.query_time += perf_counter() - start
+        self.queries += 1
+
+        return sorted((-diff, -index) for diff, index in best)
+
+
+
+    def closest(self, colour: tuple) -> tuple:
+        '''
+        returns the closest colour to `colour`
+        '''
+
+        return self.colours[self.query(colour)]
+
+
+
+    def query_many(self, colours: list) -> list:
+        '''
+        returns the index of the closest colour for each of `colours`
+        '''
+
+        return [self.query(colour) for colour in colours]
+
+
+
+## =============== LOOKUP TABLE =============== ##
+
+
+
+class ColourLUT:
+    '''
+    lookup table mapping every colour, quantized to `bits` bits \
+    per channel, to the index of its closest colour in a palette.
+
+    with `bits = 8` every colour has its own cell and the table is exact, \
+    lower values give smaller tables (`(2 ** bits) ** 3` cells) \
+    that are faster to build, matching each colour \
+    as the centre of its cell
+    '''
+
+    # side of the cubes of cells whose candidates are searched together
+
+    block = 16
+
+    def __init__(self, table, bits: int) -> None:
+        self.table = table
+        self.bits = bits
+        self.shift = 8 - bits
+
+
+
+    @classmethod
+    def build(cls, colours: list, bits: int = 6, progress_bar = None):
+        '''
+        builds the table of `colours`, one cube of cells at a time.
+
+        for each cube only the colours that could be the closest \
+        to any of its cells are compared, which are those closer \
+        to the cube than the farthest corner from the best colour.
+
+        `progress_bar` is updated once for each cube, \
+        there are `max(1, 2 ** bits // 16) ** 3` of them
+        '''
+
+        side = 1 << bits
+        shift = 8 - bits
+        block = min(side, cls.block)
+
+        palette = np.asarray(
+            [colour[:3] for colour in colours],
+            dtype = np.float32
+        ).reshape(-1, 3)
+
+        values = ((np.arange(side) << shift) + ((1 << shift) >> 1)).astype(np.float32)
+
+        table = np.empty(
+            (side, side, side),
+            dtype = np.uint16 if len(palette) <= 1 << 16 else np.uint32
+        )
+
+        for red in range(0, side, block):
+            for green in range(0, side, block):
+                for blue in range(0, side, block):
+                    low = values[[red, green, blue]]
+                    high = values[[red + block - 1, green + block - 1, blue + block - 1]]
+
+                    nearest = (
+                        np.clip(low - palette, 0, None) + np.clip(palette - high, 0, None)
+                    ) ** 2
+                    farthest = np.maximum(palette - low, high - palette) ** 2
+
+                    candidates = np.flatnonzero(
+                        nearest.sum(axis = 1) <= farthest.sum(axis = 1).min()
+                    )
+
+                    cells = np.stack(
+                        np.meshgrid(
+                            values[red:red + block],
+                            values[green:green + block],
+                            values[blue:blue + block],
+                            indexing = 'ij'
+                        ),
+                        axis = -1
+                    ).reshape(-1, 3)
+
+                    table[
+                        red:red + block,
+                        green:green + block,
+                        blue:blue + block
+                    ] = candidates[
+                        closest_indices(palette[candidates], cells)
+                    ].reshape(block, block, block)
+
+                    if progress_bar:
+                        progress_bar.update()
+
+        return cls(table, bits)
+
+
+
+    def add(self, colours: list, start: int) -> None:
+        '''
+        updates the table for the colours of `colours` from `start` on, \
+        added to the palette it was built from, comparing each cell \
+        only with its colour so far and the new ones
+        '''
+
+        palette = palette_array(colours).astype(np.float32)
+        new = palette[start:]
+
+        if not len(new):
+            return
+
+        # loaded tables are read-only memory maps, and bigger palettes
+        # may need bigger indices, so the table is copied once here
+
+        self.table = self.table.astype(
+            np.uint32 if len(palette) > 1 << 16 else self.table.dtype
+        )
+
+        side = len(self.table)
+        values = ((np.arange(side) << self.shift) + ((1 << self.shift) >> 1)).astype(np.float32)
+
+        for red in range(side):
+            cells = np.stack(
+                np.meshgrid(values[red:red + 1], values, values, indexing = 'ij'),
+                axis = -1
+            ).reshape(-1, 3)
+
+            current = self.table[red].reshape(-1)
+            nearest = closest_indices(new, cells)
+
+            # ties keep the colour they had, which has a lower index
+
+            closer = ((cells - new[nearest]) ** 2).sum(axis = 1) < \
+                ((cells - palette[current]) ** 2).sum(axis = 1)
+
+            current[closer] = nearest[closer] + start
+
+            self.table[red] = current.reshape(side, side)
+
+
+
+    def lookup(self, colours):
+        '''
+        returns the palette index of each colour \
+        of the `(n, channels)` uint8 array `colours`
+        '''
+
+        colours = np.asarray(colours, dtype = np.uint8) >> self.shift
+
+        return self.table[colours[:, 0], colours[:, 1], colours[:, 2]]
+
+
+
+    def save(self, path: str, colours: list) -> None:
+        '''
+        saves the table in the `path` `.npy` file and the palette \
+        it was built from next to it, see `colours_path`
+        '''
+
+        path = self.table_path(path)
+
+        np.save(path, self.table)
+        np.save(self.colours_path(path), palette_array(colours))
+
+
+
+    @classmethod
+    def load(cls, path: str, colours: list):
+        '''
+        memory-maps the table saved in `path`, returns `None` \
+        if it doesn't exist or was built from a palette other than `colours`
+        '''
+
+        path = cls.table_path(path)
+        colours_path = cls.colours_path(path)
+
+        if not (os.path.exists(path) and os.path.exists(colours_path)):
+            return None
+
+        if not np.array_equal(np.load(colours_path), palette_array(colours)):
+            return None
+
+        table = np.load(path, mmap_mode = 'r')
+
+        return cls(table, len(table).bit_length() - 1)
+
+
+
+    @staticmethod
+    def table_path(path: str) -> str:
+        '''
+        returns `path` ending in `.npy`, which `np.save` adds if it's missing
+        '''
+
+        return path if path.endswith('.npy') else path + '.npy'
+
+
+
+    @staticmethod
+    def colours_path(path: str) -> str:
+        '''
+        returns the path of the palette saved with the `path` table
+        '''
+
+        return path[:-4] + '_colours.npy' if path.endswith('.npy') else path + '_colours.npy'
+
+
+
+def palette_array(colours: list):
+    '''
+    returns the first three channels of `colours` as a uint8 array
+    '''
+
+    return np.asarray(
+        [colour[:3] for colour in colours],
+        dtype = np.uint8
+    ).reshape(-1, 3)
@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from time       import perf_counter, process_time
+
+import cProfile
+import json
+import sys
+import os
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+
+__all__ = [
+    'Metrics',
+    'peak_rss'
+]
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def peak_rss() -> int:
+    '''
+    returns the peak resident memory of the process in bytes, \
+    or `None` where it's not available, like on Windows
+    '''
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes on Linux, bytes on macOS
+
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+
+## =============== METRICS =============== ##
+
+
+
+class Metrics:
+    '''
+    collects, for each stage of a mosaic, like `get_frames` or `save`, \
+    its wall time, the CPU time of the process and of its children, \
+    like `ffmpeg` or the processes of `workers`, \
+    the peak resident memory of the process once it's over \
+    and what the stage counted, like frames, cells or bytes written.
+
+    ```py
+    metrics = mozaiku.Metrics(hooks = [print])
+    mozaiku.from_folder('frames', 'image.png', 'mosaic.png', 100, 20, metrics = metrics)
+    metrics.to_json('metrics.json')
+    ```
+
+    ## Optional Parameters
+    - `hooks`:\n
+      - functions called with the `dict` of each stage as soon as it ends
+    - `profile`:\n
+      - a folder where the `cProfile` stats of each stage are saved, \
+      as `<index>_<stage>.prof`, readable with `pstats`
+    '''
+
+    def __init__(self, hooks: list = None, profile: str = None) -> None:
+        self.hooks = list(hooks or [])
+        self.profile = profile
+
+        self.stages = []
+        self.counts = {}
+
+        self.active = []
+        self.profiler = None
+
+
+
+    @contextmanager
+    def stage(self, name: str):
+        '''
+        measures the code inside the `with` block as the stage `name`. \
+        stages can be nested, but only the outermost one is profiled
+        '''
+
+        stage = {
+            'name': name,
+            'nested': bool(self.active),
+            'wall': None,
+            'cpu': None,
+            'children_cpu': None,
+            'peak_rss': None,
+            'counts': {}
+        }
+
+        profiler = None
+
+        if self.profile and self.profiler is None:
+            profiler = self.profiler = cProfile.Profile()
+
+        self.active.append(stage)
+
+        times = os.times()
+        cpu = process_time()
+        start = perf_counter()
+
+        if profiler:
+            profiler.enable()
+
+        try:
+            yield stage
+        finally:
+            if profiler:
+                profiler.disable()
+
+            end = os.times()
+
+            stage['wall'] = perf_counter() - start
+            stage['cpu'] = process_time() - cpu
+            stage['children_cpu'] = end.children_user + end.children_system - \
+                times.children_user - times.children_system
+            stage['peak_rss'] = peak_rss()
+
+            self.active.pop()
+
+            if profiler:
+                self.profiler = None
+
+                os.makedirs(self.profile, exist_ok = True)
+
+                stage['profile'] = f'{self.profile}/{len(self.stages):02d}_{name}.prof'
+                profiler.dump_stats(stage['profile'])
+
+            self.stages.append(stage)
+
+            for hook in self.hooks:
+                hook(stage)
+
+
+
+    def count(self, **counts) -> None:
+        '''
+        adds `counts`, like `frames = 10`, to the stages being measured \
+        and to the totals in `self.counts`
+        '''
+
+        for name, amount in counts.items():
+            # numpy integers aren't JSON serializable
+
+            amount = getattr(amount, 'item', lambda: amount)()
+
+            for stage in self.active:
+                stage['counts'][name] = stage['counts'].get(name, 0) + amount
+
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+
+
+    def empty(self):
+        '''
+        returns new `Metrics` with the same hooks and profile folder
+        '''
+
+        return Metrics(self.hooks, self.profile)
+
+
+
+    def total(self, field: str = 'wall') -> float:
+        '''
+        returns the sum of `field` over the outermost stages
+        '''
+
+        return sum(
+            stage[field] or 0
+            for stage in self.stages
+            if not stage['nested']
+        )
+
+
+
+    def as_dict(self) -> dict:
+        return {
+            'stages': self.stages,
+            'counts': self.counts,
+            'wall': self.total('wall'),
+            'cpu': self.total('cpu'),
+            'children_cpu': self.total('children_cpu'),
+            'peak_rss': peak_rss()
+        }
+
+
+
+    def to_json(self, path: str = None) -> str:
+        '''
+        returns the metrics as JSON and saves them in `path`, if given
+        '''
+
+        text = json.dumps(self.as_dict(), indent = 4)
+
+        if path:
+            with open(path, 'w', encoding = 'utf-8') as f:
+                f.write(text)
+
+        return text
+
+
+
+    def __str__(self) -> str:
+        lines = []
+
+        for stage in self.stages:
+            counts = ', '.join(f'{k} {v}' for k, v in stage['counts'].items())
+
+            lines.append(
+                f'{stage["name"]:<24}{stage["wall"]:>10.3f}s wall'
+                f'{stage["cpu"] + stage["children_cpu"]:>10.3f}s cpu'
+                + (f'  {counts}' if counts else '')
+            )
+
+        return '\n'.join(lines)
@@ -1,12 +1,30 @@
-from distutils.dir_util import copy_tree
-from subprocess         import run
+from subprocess         import Popen, PIPE, CalledProcessError, run
+from math               import ceil
+from time               import perf_counter
 from PIL                import Image
 
 from .utils             import *
+from .matching          import *
+from .frames            import *
+from .library           import *
+from .atlas             import *
+from .writers           import *
+from .pyramid           import *
+from .metrics           import *
+from .assignment        import *
+from .pipeline          import *
+from .checkpoint        import *
+from .compose           import *
+from .encoders          import *
 
 import shutil
 import os
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 
 __all__ = [
@@ -47,13 +65,49 @@ class MOSAIC:
             clear: bool = True,
             compression_level: int = 6,
             show_progress_bar: bool = False,
-            replace_transparent: tuple = (0, 0, 0, 0)
+            replace_transparent: tuple = (0, 0, 0, 0),
+
+            workers: int = 1,
+            chunk_size: int = 16,
+
+            lut_bits: int = None,
+            lut_path: str = None,
+
+            library: str = None,
+
+            stream: bool = False,
+            band_rows: int = 16,
+
+            pipe: bool = False,
+            sampling: str = 'fps',
+            scene_threshold: float = 0.3,
+            max_frames: int = None,
+
+            mode: str = None,
+
+            dzi_tile_size: int = 254,
+            dzi_format: str = 'jpg',
+
+            metrics: Metrics = None,
+
+            max_uses: int = None,
+            min_spacing: int = 0,
+            candidates: int = 32,
+
+            pipeline: bool = False,
+
+            checkpoint: str = None,
+
+            preview: bool = False,
+
+            save_preset: str = None
         ) -> None:
 
         # Required Parameters
 
         self.image_path = image_path
         self.output_file_name = output_file_name
+        self.output_path = None
         self.sample_image = sample_image
         self.image_max_size = image_max_size
         self.frames_size = frames_size
@@ -71,13 +125,57 @@ class MOSAIC:
         self.compression_level = compression_level
         self.show_progress_bar = show_progress_bar
 
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.library = library
+
+        self.stream = stream
+        self.band_rows = band_rows
+
+        self.pipe = pipe
+        self.sampling = sampling
+        self.scene_threshold = scene_threshold
+        self.max_frames = max_frames
+
+        self.mode = mode
+
+        self.dzi_tile_size = dzi_tile_size
+        self.dzi_format = dzi_format
+
+        self.metrics = Metrics() if metrics is None else metrics
+
+        self.max_uses = max_uses
+        self.min_spacing = min_spacing
+        self.candidates = candidates
+
+        self.pipeline = pipeline
+
+        self.checkpoint = checkpoint
+
+        self.preview = preview
+
+        self.save_preset = save_preset
+
+        # Colour Lookup Table
+
+        self.lut_bits = lut_bits
+        self.lut_path = lut_path
+
         # Other Variables
 
+        self.job = None
         self.size = None
+        self.atlas = None
         self.result = None
+        self.target = None
+        self.values = None
         self.new_size = None
+        self.colour_lut = None
+        self.colour_index = None
+        self.library_index = None
         self.list_of_colours = None
         self.new_image_colours = None
+        self.render_job = None
 
         self.to_clear = [] if clear else None
 
@@ -92,21 +190,94 @@ class MOSAIC:
     def checks(self):
         error = ''
 
-        for i in (self.image_path, self.video_path, self.folder_path):
+        for i in (self.image_path, self.video_path, self.folder_path, self.sample_image):
             if i and not os.path.exists(i):
                 error += f'No such file or directory: \'{i}\'\n'
 
-        if not any([self.url, self.video_path, self.folder_path]):
-            error += '\nAt least one between url, video_path and folder_path should be set'
+        if not any([self.url, self.video_path, self.folder_path, self.sample_image]):
+            error += '\nAt least one between url, video_path, folder_path and sample_image should be set'
 
         if error:
             print(error.strip())
             raise FileNotFoundError
 
-        img = Image.open(self.image_path)
-        self.type = img.mode
+        if self.sampling not in SAMPLINGS:
+            print('sampling should be one of ' + ', '.join(SAMPLINGS))
+            raise ValueError
+
+        self.check_output()
+        self.check_render_options()
+
+        if self.lut_bits is not None:
+            if not HAS_NUMPY:
+                print('lut_bits requires numpy, install it with `pip install numpy`')
+                raise ImportError
+
+            if not 1 <= self.lut_bits <= 8:
+                print('lut_bits should be between 1 and 8')
+                raise ValueError
+
+        if self.mode:
+            self.type = self.mode
+        else:
+            img = Image.open(self.image_path)
+            self.type = img.mode
+            img.close()
+
         self.replace_transparent = self.replace_transparent[:len(self.type)]
-        img.close()
+
+
+
+    def check_render_options(self):
+        '''
+        checks the options that can change for each mosaic \
+        of a `TileLibrary`, see `TileLibrary.render`
+        '''
+
+        if self.save_preset is not None and self.save_preset not in ENCODE_PRESETS:
+            print('save_preset should be one of ' + ', '.join(ENCODE_PRESETS))
+            raise ValueError
+
+        if self.max_uses is not None and self.max_uses < 1:
+            print('max_uses should be at least 1')
+            raise ValueError
+
+        if self.min_spacing < 0 or self.candidates < 1:
+            print('min_spacing should be at least 0 and candidates at least 1')
+            raise ValueError
+
+
+
+    def check_output(self):
+        '''
+        checks that the mosaic can be saved as `self.output_file_name`
+        '''
+
+        # previews are saved by Pillow, see `create_preview`
+
+        if self.preview and self.output_file_name:
+            if '.' + self.get_extension() not in Image.registered_extensions():
+                print(
+                    f'previews can\'t be saved as .{self.get_extension()} files, '
+                    'use an image format like png or jpg'
+                )
+                raise ValueError
+        elif self.is_pyramid():
+            if not HAS_NUMPY:
+                print('.dzi output requires numpy, install it with `pip install numpy`')
+                raise ImportError
+
+            if self.dzi_format not in DZI_FORMATS:
+                print('dzi_format should be one of ' + ', '.join(DZI_FORMATS))
+                raise ValueError
+        elif self.stream and self.output_file_name:
+            if not HAS_NUMPY:
+                print('stream requires numpy, install it with `pip install numpy`')
+                raise ImportError
+
+            if self.get_extension() not in STREAM_FORMATS:
+                print('stream supports only ' + ', '.join(STREAM_FORMATS) + ' files')
+                raise ValueError
 
 
 
@@ -117,14 +288,11 @@ class MOSAIC:
         of the given `image_path` image
         '''
 
-        self.video_path = self.get_first_available('video', 'mp4')
-
-        if self.clear:
-            self.to_clear.append(self.video_path)
+        self.prepare_in_background()
 
-        log_func(self.download_video, 'Downloading video', self.log)
+        self.ingest_youtube()
 
-        return self.from_video()
+        return self.render_and_clear()
 
 
 
@@ -134,391 +302,1800 @@ class MOSAIC:
         to create a photo mosaic of the given `image_path` image
         '''
 
-        self.folder_path = self.get_first_available(self.folder, '')
-        os.mkdir(self.folder_path)
+        self.prepare_in_background()
 
-        if self.clear:
-            self.to_clear.append(self.folder_path)
-
-        log_func(self.extract_frames, 'Extracting frames', self.log)
+        self.ingest_video()
 
-        return self.from_folder()
+        return self.render_and_clear()
 
 
 
     def from_folder(self, frames_are_already_squares: bool = False) -> Image:
         '''
         uses images from the `self.folder_path` folder to create \
-        a photo mosaic of the `self.image_path` image
+        a photo mosaic of the `self.image_path` image.
+
+        returns `None` if `self.stream` is set, \
+        since the image is never whole in memory
 
         ## Optional Parameter
         - `frames_are_already_squares`:\n
           - skip the step of cropping all frames to square
         '''
 
-        log_func(
-            self.get_frames,
-            'Selecting valid frames',
-            self.log,
-            frames_are_already_squares
-        )
+        self.prepare_in_background()
 
-        log_func(self.generate_new_image, 'Generating list of images', self.log)
+        self.ingest_folder(frames_are_already_squares)
 
-        img = log_func(self.create_mosaic, 'Creating mosaic', self.log)
+        return self.render_and_clear()
 
-        log_func(self.save, 'Saving image', self.log, img)
 
-        if self.clear:
-            self.clear_files(self.to_clear + [self.folder_path])
 
-        return img
+    def prepare_in_background(self) -> None:
+        '''
+        starts `prepare_image` in a thread if `self.pipeline` is set, \
+        so that the image is ready by the time the frames are
+        '''
 
+        if self.pipeline:
+            self.target = in_background(self.prepare_image)
 
 
-    def from_image(self) -> Image:
+
+    def ingest_youtube(self) -> None:
         '''
-        something
+        downloads the video from `self.url` and gets its frames, \
+        see `ingest_video`
         '''
 
-        data = Image.open(self.image_path).convert(self.type).getdata()
+        self.open_checkpoint()
 
-        self.new_image_colours = []
-        closest = {}
+        if self.open_library(self.url):
+            return self.ingest_folder()
 
-        for i in data:
-            if i[-1] == 0:
-                self.new_image_colours.append(0)
-            else:
-                if i not in closest:
-                    closest[i] = self.get_closest_colour(self.list_of_colours, i)
+        if self.job:
+            self.video_path = self.job.file('video.mp4')
+        else:
+            self.video_path = self.get_first_available('video', 'mp4')
 
-                self.new_image_colours.append(closest[i])
+            if self.clear:
+                self.to_clear.append(self.video_path)
+
+        if self.job and self.job.done('video'):
+            if self.log:
+                print('Video already downloaded\n')
+        else:
+            log_func(self.download_video, 'Downloading video', self.log, metrics = self.metrics)
 
-        for i in range(len(data)):
-            data[i] = self.new_image_colours[i]
+            if self.job:
+                self.job.set('video')
 
+        self.ingest_video()
 
 
-    def get_pixels(self) -> None:
+
+    def ingest_video(self) -> None:
         '''
-        saves the average color of all frames in `self.folder_path` \
-        skipping duplicates, resizes all frames and save them in a new folder
+        extracts the frames of `self.video_path` and gets them, \
+        see `ingest_folder`
         '''
 
-        count = 1
+        self.open_checkpoint()
 
-        result = {0: self.replace_transparent}
-        values = [self.replace_transparent]
+        if self.open_library(self.video_path) or self.pipe:
+            return self.ingest_folder(True)
 
-        pixels = Image.open(self.sample_image).getdata()
+        if self.job:
+            self.folder_path = self.job.file('frames')
+        else:
+            self.folder_path = self.get_first_available(self.folder, '')
 
-        for i in pixels:
-            with Image.open(self.folder_path + '/' + i) as image:
-                res = image.resize((1, 1)).getdata()[0]
+            if self.clear:
+                self.to_clear.append(self.folder_path)
 
-                if len(res) == 3 and self.type == 'RGBA':
-                    res += (255,)
+        if self.job and self.job.done('frames'):
+            if self.log:
+                print('Frames already extracted\n')
+        else:
+            # frames of an extraction that didn't finish are extracted again
 
-                if res not in values:
-                    values.append(res)
-                    result[count] = res
+            shutil.rmtree(self.folder_path, ignore_errors = True)
+            os.mkdir(self.folder_path)
 
-                count += 1
+            log_func(self.extract_frames, 'Extracting frames', self.log, metrics = self.metrics)
 
-        self.size = image.size[0]
-        self.result = result
-        self.list_of_colours = result.values()
+            if self.job:
+                self.job.set('frames')
 
+        # frames are cropped and resized by `ffmpeg`
 
+        self.ingest_folder(True)
 
-    def extract_frames(self) -> None:
+
+
+    def ingest_folder(self, frames_are_already_squares: bool = False) -> None:
         '''
-        uses `ffmpeg` to extract frames from the `self.video_path` video
+        gets the frames in `self.folder_path`, see `get_frames`. \
+        after this, any number of images can be rendered with `render`
         '''
 
-        run(
-            'ffmpeg -hide_banner -loglevel error' + \
-            ['', ' -stats'][self.log] + \
-            f' -i {self.video_path}' \
-            f' -r {self.fps} {self.folder_path}/out-%06d.jpg',
-            check = True
+        self.open_checkpoint()
+
+        log_func(
+            self.get_frames,
+            'Selecting valid frames',
+            self.log,
+            frames_are_already_squares,
+            metrics = self.metrics
         )
 
 
 
-    def download_video(self) -> None:
+    def render(self) -> Image:
         '''
-        downloads the best possible quality video from the `self.url` url
+        creates the photo mosaic of `self.image_path` \
+        with the frames got by one of the `ingest_*` methods \
+        and saves it as `self.output_file_name`.
+
+        returns `None` if `self.stream` is set, the output is a `.dzi` pyramid \
+        or the checkpoint of the mosaic says it was already saved
         '''
 
-        run(
-            f'youtube-dl -o "{self.video_path}" -f best {self.url}',
-            check = True
-        )
+        if self.preview:
+            img = log_func(self.create_preview, 'Creating preview', self.log, metrics = self.metrics)
 
+            log_func(self.save, 'Saving image', self.log, img, metrics = self.metrics)
 
+            return img
 
-    def get_frames(self, frames_are_already_squares: bool = False) -> None:
-        '''
-        saves the average color of all frames in `self.folder_path` \
-        skipping duplicates, resizes all frames and save them in a new folder
+        self.open_render_checkpoint()
 
-        ## Optional Parameter
-        - `frames_are_already_squares`:\n
-          - skip the step of cropping all frames to square
-        '''
+        if (
+            self.render_job and self.render_job.done('saved')
+            and os.path.exists(self.get_output_file_name())
+        ):
+            if self.log:
+                print(f'Mosaic already saved as \'{self.output_path}\'\n')
 
-        count = 1
+            return None
 
-        result = {0: self.replace_transparent}
-        values = [self.replace_transparent]
+        if not self.load_assignment():
+            log_func(
+                self.generate_new_image,
+                'Generating list of images',
+                self.log,
+                metrics = self.metrics
+            )
 
-        new_folder = self.get_first_available(self.folder_path, '')
-        os.mkdir(new_folder)
+            if self.render_job:
+                self.render_job.dump('assignment', [self.new_size, self.new_image_colours])
 
-        frames = os.listdir(self.folder_path)
+        img = self.save_output()
 
-        progress_bar = progress_bar_func(len(frames), self.show_progress_bar)
+        if self.render_job:
+            self.render_job.set('saved')
 
-        for i in frames:
-            with Image.open(self.folder_path + '/' + i) as image:
-                width, height = image.size
-                new = min(width, height)
-
-                left    = (width  - new) / 2
-                top     = (height - new) / 2
-                right   = (width  + new) / 2
-                bottom  = (height + new) / 2
-
-                if not frames_are_already_squares:
-                    image = image.crop(
-                        (left, top, right, bottom)
-                    ).resize(
-                        (self.frames_size, self.frames_size)
-                    )
+        return img
 
-                    image.save(new_folder + '/' + i)
-                else:
-                    copy_tree(self.folder_path, new_folder)
 
-                res = image.resize((1, 1)).getdata()[0]
 
-                if len(res) == 3 and self.type == 'RGBA':
-                    res += (255,)
+    def save_output(self) -> Image:
+        '''
+        creates the mosaic from `self.new_image_colours` and saves it \
+        in the format of `self.output_file_name`, see `render`
+        '''
 
-                if res not in values:
-                    values.append(res)
-                    result[count] = res
+        if self.is_pyramid():
+            log_func(
+                self.save_pyramid,
+                'Creating and saving pyramid',
+                self.log,
+                metrics = self.metrics
+            )
 
-                count += 1
-            progress_bar.update()
+            return None
 
-        progress_bar.end()
+        if self.stream:
+            log_func(
+                self.save_stream,
+                'Creating and saving mosaic',
+                self.log,
+                metrics = self.metrics
+            )
 
-        self.size = image.size[0]
-        self.result = result
-        self.list_of_colours = result.values()
+            return None
 
-        self.folder_path = new_folder
+        # with `workers`, creating and compressing the mosaic in many processes
+        # and threads is faster than overlapping them in one thread each
 
+        if (
+            self.pipeline and self.workers == 1
+            and HAS_NUMPY and self.get_extension() in STREAM_FORMATS
+        ):
+            return log_func(
+                self.create_and_save,
+                'Creating and saving mosaic',
+                self.log,
+                metrics = self.metrics
+            )
 
+        img = log_func(self.create_mosaic, 'Creating mosaic', self.log, metrics = self.metrics)
 
-    def generate_new_image(self) -> None:
+        log_func(self.save, 'Saving image', self.log, img, metrics = self.metrics)
+
+        return img
+
+
+
+    def render_and_clear(self) -> Image:
         '''
-        generates a list of colours corresponding to the closest colours of \
-        the average of each frame, previously saved in `self.result`
+        calls `render`, then deletes temporary files if `self.clear` is set
         '''
 
-        image = Image.open(self.image_path).convert(self.type)
+        img = self.render()
 
-        max_size = self.image_max_size / max(image.size)
+        if self.clear:
+            self.clear_files(self.to_clear)
 
-        self.new_size = (int(image.size[0] * max_size), int(image.size[1] * max_size))
+            if self.job:
+                self.job.remove()
 
-        image = image.resize(self.new_size)
+        return img
 
-        data = image.getdata()
-        closest = {}
 
-        self.new_image_colours = []
 
-        progress_bar = progress_bar_func(len(data), self.show_progress_bar)
+    def open_checkpoint(self) -> None:
+        '''
+        opens the checkpoint of the frames of this job in the \
+        `self.checkpoint` folder, if set, where the video, its frames \
+        and, unless `self.library` is set, the tile library are kept \
+        until the mosaic is done, so a job that stopped goes on \
+        from where it was when it's run again
+        '''
 
-        for i in data:
-            if i[-1] == 0:
-                self.new_image_colours.append(0)
-            else:
-                if i not in closest:
-                    closest[i] = self.get_closest_colour(self.list_of_colours, i)
+        if not self.checkpoint or self.job:
+            return
 
-                self.new_image_colours.append(closest[i])
+        source = self.url or os.path.abspath(self.video_path or self.folder_path)
 
-            progress_bar.update()
+        self.job = Checkpoint(self.checkpoint, [
+            source,
+            self.frames_size,
+            self.fps,
+            self.type,
+            self.sampling,
+            self.scene_threshold,
+            self.max_frames
+        ])
 
-        progress_bar.end()
+        # keys of the tiles must be the same when the job goes on,
+        # and the library saves them with the tiles
 
+        if not self.library:
+            self.library = self.job.file('library')
 
 
-    def get_closest_colour(
-            self,
-            colours: list,
-            colour: tuple
-        ) -> tuple:
+
+    def open_render_checkpoint(self) -> None:
         '''
-        returns an `(r, g, b)` tuple of the closests colour \
-        to the given `colour` from a given list of `colours`
+        opens the checkpoint of the mosaic of `self.image_path`, \
+        inside the one of the frames, see `open_checkpoint`, \
+        where the tile of each cell and the bands written are kept.
+
+        if the frames were got without `self.checkpoint`, like when \
+        it's set only for a mosaic of a `TileLibrary`, the one of the frames \
+        is opened now, just to hold the mosaic
         '''
 
-        min_diff = 200000
-        final_colour = 0
+        if not self.checkpoint:
+            return
 
-        red, green, blue = colour[:3]
+        if not self.job:
+            library = self.library
 
-        for i in colours:
-            i_red, i_green, i_blue = i[:3]
+            self.open_checkpoint()
 
-            diff_1, diff_2, diff_3 = red - i_red, green - i_green, blue - i_blue
-            colour_diff = diff_1 * diff_1 + diff_2 * diff_2 + diff_3 * diff_3
+            # the frames are already got, so their library stays as it was
 
-            if colour_diff < min_diff:
-                min_diff = colour_diff
-                final_colour = i
+            self.library = library
 
-        return final_colour
+        stat = os.stat(self.image_path)
 
+        self.render_job = self.job.child([
+            os.path.abspath(self.image_path),
+            stat.st_mtime_ns,
+            stat.st_size,
+            self.output_file_name,
+            self.image_max_size,
+            self.type,
+            list(self.replace_transparent),
+            self.lut_bits,
+            self.max_uses,
+            self.min_spacing,
+            self.candidates,
+            self.stream,
+            self.band_rows,
+            self.compression_level,
+            self.save_preset,
+            self.dzi_tile_size,
+            self.dzi_format
+        ])
+
+
+
+    def load_assignment(self) -> bool:
+        '''
+        gets `self.new_size` and `self.new_image_colours` from the checkpoint \
+        of the mosaic, if they were saved, and returns whether it did
+        '''
 
+        data = self.render_job.load('assignment') if self.render_job else None
 
-    def get_first_available(
-            self,
-            file_name: str,
-            ext: str,
+        if data is None:
+            return False
 
-            sep: str = '_',
-            start_num: int = 1,
-            format_digits: int = 1,
-            check_without: bool = True
-        ) -> str:
-        '''
-        returns the first name that is not already used in th current dir.
+        new_size, colours = data
 
-        for example, if in the current directory you have:\n
-        - file.txt
-        - file_1.txt
-        - file-1.txt
-        - file_2.txt
+        # frames removed since then can't be used anymore
 
-        ```py
-        self.get_first_available('file', 'txt')
-        ```
+        if not set(colours) - {0} <= self.values:
+            return False
 
-        will return `file_3.txt`, whereas
+        self.new_size, self.new_image_colours = new_size, colours
 
-        ```py
-        self.get_first_available('file', 'txt', sep = '-')
-        ```
+        if self.log:
+            print('List of images loaded from checkpoint\n')
 
-        will return `file-2.txt`
-        '''
+        return True
 
-        ext = '.' + ext if ext else ext
 
-        *folder, file_name = file_name.replace('\\', '/').split('/')
-        folder = '/'.join(folder)
 
-        if folder:
-            folder += '/'
-            files = os.listdir(folder)
-        else:
-            files = os.listdir()
+    def render_video(self, threshold: float = 8) -> None:
+        '''
+        creates the photo mosaic of each frame of the `self.image_path` \
+        video with the frames got by one of the `ingest_*` methods \
+        and encodes them, with the audio of the video, \
+        in the `self.output_file_name` video.
 
-        if check_without:
-            if file_name + ext not in files:
-                return folder + file_name + ext
+        frames go through `ffmpeg` pipes one at a time, \
+        so memory doesn't grow with the length of the video.
 
-        count = start_num
-        num = str(count).zfill(format_digits)
-        file_name_count = file_name + sep + num + ext
+        cells whose colour is less than `threshold` away from the colour \
+        they had when they were last matched keep their tile, \
+        so only cells that changed are matched and copied again
+        '''
 
-        while file_name_count in files:
-            count += 1
-            num = str(count).zfill(format_digits)
-            file_name_count = file_name + sep + num + ext
+        if not HAS_NUMPY:
+            print('video mosaics require numpy, install it with `pip install numpy`')
+            raise ImportError
 
-        return folder + file_name_count
+        if self.type not in PIXEL_FORMATS:
+            print('video mosaics support only ' + ', '.join(PIXEL_FORMATS) + ' tiles')
+            raise ValueError
+
+        log_func(
+            self.encode_video,
+            'Creating and encoding video mosaic',
+            self.log,
+            threshold,
+            metrics = self.metrics
+        )
 
 
 
-    def create_mosaic(self) -> Image:
+    def encode_video(self, threshold: float) -> None:
         '''
-        creates the final image pasting all \
-        the valid frames from `self.new_image_colours`
+        see `render_video`
         '''
 
-        key, val = list(self.result), list(self.result.values())
-        files = os.listdir(self.folder_path)
+        width, height, frame_rate = video_info(self.image_path)
 
-        new_im = Image.new(
-            self.type,
-            self.get_output_size(),
-            self.replace_transparent
+        max_size = self.image_max_size / max(width, height)
+
+        self.new_size = (
+            max(1, int(width * max_size)),
+            max(1, int(height * max_size))
         )
 
+        columns, rows = self.new_size
+        channels = len(self.type)
 
-        used_images = [0]
+        tiles = self.get_palette_tiles()
 
-        progress_bar = progress_bar_func(
-            len(self.new_image_colours),
-            self.show_progress_bar
+        # the average colour of each cell comes straight from `ffmpeg`,
+        # frames are resized so that each pixel is a cell
+
+        frames = read_frames(
+            [
+                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+                '-i', self.image_path,
+                '-vf', f'scale={columns}:{rows}:flags=area'
+            ],
+            self.new_size
+        )
+
+        file_name = self.get_output_file_name()
+
+        encoder = Popen(
+            encode_command(
+                file_name,
+                self.get_output_size(),
+                self.type,
+                frame_rate,
+                self.image_path
+            ),
+            stdin = PIPE
         )
 
-        for i in self.new_image_colours:
-            if i not in used_images:
-                used_images.append(i)
+        assignment = np.zeros((rows, columns), dtype = np.intp)
+        matched = np.zeros((rows, columns, channels), dtype = np.int32)
+        frame = np.empty((rows * self.size, columns * self.size, channels), dtype = np.uint8)
 
-                # I use .index because I know all values are different
+        first = True
+        count = rematched = 0
 
-                img = Image.open(
-                    f'{self.folder_path}/{files[key[val.index(i) - 1]]}'
-                ).convert(self.type)
+        start = perf_counter()
 
-                places = [
-                    j for j in range(len(self.new_image_colours))
-                    if self.new_image_colours[j] == i
-                ]
+        try:
+            for data in frames:
+                cells = np.full((rows, columns, channels), 255, dtype = np.int32)
+                cells[..., :3] = np.frombuffer(data, dtype = np.uint8).reshape(rows, columns, 3)
 
-                for k in places:
-                    new_im.paste(
-                        img,
-                        (
-                            (k % self.new_size[0]) * self.size,
-                            (k // self.new_size[0]) * self.size
-                        )
-                    )
+                if first:
+                    changed = np.ones((rows, columns), dtype = bool)
+                else:
+                    changed = ((cells - matched) ** 2).sum(axis = 2) > threshold ** 2
 
-                img.close()
+                if changed.any():
+                    unique, inverse = unique_colours(cells[changed].astype(np.uint8))
+                    indices = np.array(self.match_colours(unique), dtype = np.intp)[inverse]
 
-            progress_bar.update()
+                    moved = changed.copy()
+                    moved[changed] = indices != assignment[changed]
 
-        progress_bar.end()
+                    assignment[changed] = indices
+                    matched[changed] = cells[changed]
 
-        return new_im
+                    self.update_frame(frame, assignment, tiles, moved, first)
 
+                    rematched += len(indices)
 
+                try:
+                    encoder.stdin.write(frame)
+                except BrokenPipeError:
+                    break
 
-    def save(self, image: Image) -> None:
-        file_name = self.get_first_available(
-            '.'.join(self.output_file_name.split('.')[:-1]),
-            self.output_file_name.split('.')[-1]
-        )
+                first = False
+                count += 1
+        finally:
+            frames.close()
 
-        log_func(
-            image.save,
-            'Saving mosaic',
-            self.log, file_name,
-            compression_level = self.compression_level
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+
+            encoder.wait()
+
+        if encoder.returncode:
+            raise CalledProcessError(encoder.returncode, encoder.args)
+
+        elapsed = perf_counter() - start
+
+        self.metrics.count(
+            frames = count,
+            cells = count * rows * columns,
+            cells_matched = rematched,
+            bytes_written = os.path.getsize(file_name)
         )
 
+        if self.log and count:
+            print(
+                f'\t{count} frames in {elapsed:.3f}s, {count / elapsed:.1f} frames/s, '
+                f'{rematched / (count * rows * columns):.1%} of cells matched'
+            )
+
+
+
+    def update_frame(self, frame, assignment, tiles, moved, whole: bool = False) -> None:
+        '''
+        copies in `frame` the tiles of the cells whose tile `moved`, \
+        or renders it again band by band if they're many or `whole` is set
+        '''
+
+        size = self.size
+
+        if whole or moved.sum() * 4 > moved.size:
+            for start in range(0, len(assignment), self.band_rows):
+                end = min(start + self.band_rows, len(assignment))
+
+                frame[start * size:end * size] = self.render_rows(assignment, tiles, start, end)
+
+            return
+
+        for row, column in zip(*np.nonzero(moved)):
+            frame[
+                row * size:(row + 1) * size,
+                column * size:(column + 1) * size
+            ] = tiles[assignment[row, column]]
+
+
+
+    def from_image(self) -> Image:
+        '''
+        maps each pixel of the `self.image_path` image to the closest \
+        of the colours of the `self.sample_image` image \
+        and saves the result as `self.output_file_name`, see `create_preview`
+        '''
+
+        log_func(self.get_pixels, 'Getting colours', self.log, metrics = self.metrics)
+
+        img = log_func(self.create_preview, 'Creating image', self.log, metrics = self.metrics)
+
+        log_func(self.save, 'Saving image', self.log, img, metrics = self.metrics)
+
+        return img
+
+
+
+    def get_pixels(self) -> None:
+        '''
+        saves the colours of the `self.sample_image` image, \
+        skipping duplicates, as if each was the colour of a tile \
+        of one pixel, so that images can be mapped to them
+        '''
+
+        image = Image.open(self.sample_image).convert(self.type)
+
+        if HAS_NUMPY:
+            colours = map(tuple, unique_pixels(image)[0].tolist())
+        else:
+            colours = dict.fromkeys(image.getdata())
+
+        result = {0: self.replace_transparent}
+        values = {self.replace_transparent}
+
+        for res in colours:
+            if res not in values:
+                values.add(res)
+                result[len(result)] = res
+
+        self.metrics.count(unique_colours = len(result) - 1)
+
+        self.size = 1
+        self.result = result
+        self.values = values
+        self.list_of_colours = result.values()
+
+        self.build_index()
+
+
+
+    def extract_frames(self) -> None:
+        '''
+        uses `ffmpeg` to extract frames from the `self.video_path` video, \
+        already cropped to square and resized to `self.frames_size`
+        '''
+
+        run(
+            self.ffmpeg_command(['-qscale:v', '2', f'{self.folder_path}/out-%06d.jpg']),
+            check = True
+        )
+
+        self.metrics.count(frames_extracted = len(os.listdir(self.folder_path)))
+
+
+
+    def ffmpeg_command(self, output: list) -> list:
+        '''
+        returns the `ffmpeg` command extracting the frames \
+        of `self.video_path` to `output`, see `ffmpeg_command`
+        '''
+
+        return ffmpeg_command(
+            self.video_path,
+            output,
+            self.frames_size,
+            self.fps,
+
+            self.sampling,
+            self.scene_threshold,
+            self.max_frames,
+            self.log
+        )
+
+
+
+    def download_video(self) -> None:
+        '''
+        downloads the best possible quality video from the `self.url` url
+        '''
+
+        run(
+            f'youtube-dl -o "{self.video_path}" -f best {self.url}',
+            check = True
+        )
+
+        self.metrics.count(bytes_written = os.path.getsize(self.video_path))
+
+
+
+    def get_frames(self, frames_are_already_squares: bool = False) -> None:
+        '''
+        saves the average color of all frames in `self.folder_path` \
+        skipping duplicates, resizes all frames and keeps them \
+        in `self.atlas`
+
+        ## Optional Parameter
+        - `frames_are_already_squares`:\n
+          - skip the step of cropping all frames to square
+        '''
+
+        if self.library:
+            return self.get_frames_from_library(frames_are_already_squares)
+
+        if self.pipe and not self.folder_path:
+            return self.get_frames_from_video()
+
+        # sorted, so that keys of `self.result` are always the same
+
+        frames = sorted(os.listdir(self.folder_path))
+
+        progress_bar = progress_bar_func(len(frames), self.show_progress_bar)
+
+        jobs = [
+            (
+                self.folder_path + '/' + i,
+                self.frames_size,
+                frames_are_already_squares,
+                self.type
+            )
+            for i in frames
+        ]
+
+        self.add_frames(
+            process_frames(jobs, self.workers, self.chunk_size),
+            progress_bar
+        )
+
+
+
+    def get_frames_from_video(self) -> None:
+        '''
+        same as `get_frames`, but uses the frames of `self.video_path` \
+        straight from `ffmpeg`, without saving them
+        '''
+
+        self.add_frames(
+            self.read_video_frames(),
+            progress_bar_func(0, False)
+        )
+
+
+
+    def add_frames(self, frames, progress_bar) -> None:
+        '''
+        saves the average colour of all `frames`, the `(colour, raw pixels)` \
+        of each frame in order, skipping duplicates, \
+        and keeps their pixels in `self.atlas`
+        '''
+
+        count = 1
+
+        result = {0: self.replace_transparent}
+        values = {self.replace_transparent}
+        atlas = TileAtlas(self.frames_size, self.type)
+
+        for res, data in frames:
+            if len(res) == 3 and self.type == 'RGBA':
+                res += (255,)
+
+            if res not in values:
+                values.add(res)
+                result[count] = res
+                atlas.add(count, data)
+
+            count += 1
+            progress_bar.update()
+
+        progress_bar.end()
+
+        self.metrics.count(frames = count - 1, unique_colours = len(result) - 1)
+
+        self.size = self.frames_size
+        self.atlas = atlas
+        self.result = result
+        self.values = values
+        self.list_of_colours = result.values()
+
+        self.build_index()
+
+
+
+    def get_frames_from_library(self, frames_are_already_squares: bool = False) -> None:
+        '''
+        same as `get_frames`, but keeps the resized frames in the \
+        `self.library` tile library and resizes only those that \
+        were added or changed since the last time the library was used
+        '''
+
+        if self.library_index is None:
+            self.library_index = LibraryIndex(
+                self.library,
+                self.folder_path,
+                self.frames_size,
+                frames_are_already_squares,
+                mode = self.type
+            )
+
+        library = self.library_index
+
+        if not library.is_up_to_date() and self.pipe and not self.folder_path:
+            count = library.rebuild(self.read_video_frames())
+
+            self.metrics.count(frames_processed = count)
+
+            if self.log:
+                print(f'\t{count} frames added')
+        elif not library.is_up_to_date():
+            progress_bar = progress_bar_func(
+                len(os.listdir(self.folder_path)),
+                self.show_progress_bar
+            )
+
+            added, changed, removed = library.update(
+                self.folder_path,
+                self.workers,
+                self.chunk_size,
+                progress_bar
+            )
+
+            progress_bar.end()
+
+            self.metrics.count(frames_processed = added + changed)
+
+            if self.log:
+                print(f'\t{added} frames added, {changed} changed, {removed} removed')
+
+        result = {0: self.replace_transparent}
+        values = {self.replace_transparent}
+
+        for key, res in library.tiles():
+            if len(res) == 3 and self.type == 'RGBA':
+                res += (255,)
+
+            if res not in values:
+                values.add(res)
+                result[key] = res
+
+        self.metrics.count(frames = len(library.frames), unique_colours = len(result) - 1)
+
+        self.size = self.frames_size
+        self.atlas = library.atlas()
+        self.result = result
+        self.values = values
+        self.list_of_colours = result.values()
+
+        self.build_index()
+
+
+
+    def append_tiles(self, mosaic) -> int:
+        '''
+        adds the tiles of `mosaic`, got by one of its `ingest_*` methods \
+        with the same `frames_size` and mode, to those of this one, \
+        skipping colours already there, and returns how many were added.
+
+        keys of `self.result` don't change, new tiles get keys after them, \
+        and the index and the lookup table are updated, \
+        not built again, so the cost depends only on the new tiles.
+
+        if `self.library` is set, new tiles are added to its files too, \
+        so they're there the next time it's opened
+        '''
+
+        offset = max(self.result)
+        start = len(self.result)
+
+        added = []
+
+        for key, res in list(mosaic.result.items())[1:]:
+            if res not in self.values:
+                self.values.add(res)
+                added.append(key)
+
+        if self.library_index:
+            new_keys = self.library_index.append(
+                [(mosaic.result[key], mosaic.atlas.tile(key)) for key in added]
+            )
+        else:
+            new_keys = [offset + key for key in added]
+
+        keys = dict(zip(added, new_keys))
+
+        for key, new_key in keys.items():
+            self.result[new_key] = mosaic.result[key]
+
+        # the memory map of the library covers only the tiles it had
+
+        if self.library_index:
+            self.atlas = self.library_index.atlas()
+        else:
+            self.atlas.extend(mosaic.atlas, keys)
+
+        # `self.list_of_colours` is a view of `self.result`, already up to date
+
+        new = [self.result[key] for key in keys.values()]
+
+        self.colour_index.add(new)
+
+        if self.colour_lut:
+            self.colour_lut.add(list(self.list_of_colours), start)
+
+            if self.lut_path:
+                self.colour_lut.save(self.lut_path, list(self.list_of_colours))
+
+        self.metrics.count(frames = len(mosaic.result) - 1, unique_colours = len(new))
+
+        return len(new)
+
+
+
+    def read_video_frames(self):
+        '''
+        yields the `(colour, raw pixels)` of each frame of `self.video_path`, \
+        decoded by `ffmpeg` and sent through a pipe, \
+        then prints how many frames per second were processed
+        '''
+
+        size = (self.frames_size, self.frames_size)
+
+        jobs = (
+            (data, size, self.frames_size, True, self.type)
+            for data in read_frames(self.ffmpeg_command([]), size)
+        )
+
+        start = perf_counter()
+        count = 0
+
+        for frame in process_stream(jobs, self.workers):
+            count += 1
+            yield frame
+
+        elapsed = perf_counter() - start
+
+        if self.log:
+            print(f'\t{count} frames in {elapsed:.3f}s, {count / elapsed:.1f} frames/s')
+
+
+
+    def open_library(self, source: str) -> bool:
+        '''
+        opens the tile library of the `source` video or url, \
+        if `self.library` is set, and returns whether it's up to date, \
+        in which case the video doesn't need to be downloaded \
+        and its frames don't need to be extracted again
+        '''
+
+        if not self.library:
+            return False
+
+        if self.library_index is None:
+            self.library_index = LibraryIndex(
+                self.library,
+                source,
+                self.frames_size,
+                fps = self.fps,
+                mode = self.type,
+                sampling = [self.sampling, self.scene_threshold, self.max_frames]
+            )
+
+        return self.library_index.is_up_to_date()
+
+
+
+    def generate_new_image(self) -> None:
+        '''
+        generates a list of colours corresponding to the closest colours of \
+        the average of each frame, previously saved in `self.result`
+        '''
+
+        if self.target is None:
+            image, pixels = self.prepare_image()
+        else:
+            image, pixels = self.target.result()
+            self.target = None
+
+        self.generate_from_image(image, pixels)
+
+
+
+    def generate_from_image(self, image: Image, pixels: tuple = None) -> None:
+        '''
+        same as `generate_new_image`, but with the `image` \
+        and `pixels` already returned by `prepare_image`
+        '''
+
+        if self.max_uses or self.min_spacing:
+            return self.generate_spread_image(image, pixels)
+
+        if HAS_NUMPY:
+            return self.generate_new_image_numpy(image, pixels)
+
+        data = image.getdata()
+        closest = {}
+
+        self.new_image_colours = []
+
+        progress_bar = progress_bar_func(len(data), self.show_progress_bar)
+
+        for i in data:
+            if i[-1] == 0:
+                self.new_image_colours.append(0)
+            else:
+                if i not in closest:
+                    closest[i] = self.colour_index.closest(i)
+
+                self.new_image_colours.append(closest[i])
+
+            progress_bar.update()
+
+        progress_bar.end()
+
+        # cells whose colour was already matched are read from `closest`
+
+        transparent = self.new_image_colours.count(0)
+
+        self.metrics.count(
+            cells = len(data),
+            target_colours = len(closest),
+            cache_hits = len(data) - transparent - len(closest)
+        )
+
+        self.log_index_times()
+
+
+
+    def prepare_image(self) -> tuple:
+        '''
+        opens the `self.image_path` image, resizes it to `self.new_size` \
+        and returns it with its unique pixels, see `unique_pixels`, \
+        or `None` instead of them if there's no `numpy`
+        '''
+
+        image = Image.open(self.image_path).convert(self.type)
+
+        max_size = self.image_max_size / max(image.size)
+
+        self.new_size = (int(image.size[0] * max_size), int(image.size[1] * max_size))
+
+        image = image.resize(self.new_size)
+
+        return image, unique_pixels(image) if HAS_NUMPY else None
+
+
+
+    def create_preview(self) -> Image:
+        '''
+        returns the `self.image_path` image resized like for the mosaic, \
+        with each cell of the colour of its tile, so one pixel for each tile, \
+        to see how the mosaic will look before creating it.
+
+        with `numpy` it never loops over the cells: each unique colour \
+        is matched once and cells get their colour by indexing
+        '''
+
+        if self.target is None:
+            image, pixels = self.prepare_image()
+        else:
+            image, pixels = self.target.result()
+            self.target = None
+
+        width, height = self.new_size
+
+        if not HAS_NUMPY or self.max_uses or self.min_spacing:
+            # the tile of each cell depends on the others, see `generate_spread_image`
+
+            self.generate_from_image(image, pixels)
+
+            new_im = Image.new(self.type, self.new_size)
+            new_im.putdata([
+                self.replace_transparent if colour == 0 else colour
+                for colour in self.new_image_colours
+            ])
+
+            return new_im
+
+        unique, inverse = pixels
+
+        colours = np.array(list(self.list_of_colours), dtype = np.uint8)
+        indices = self.match_colours(unique, self.show_progress_bar)
+
+        if not self.colour_lut and len(colours) >= INDEX_THRESHOLD:
+            self.log_index_times()
+
+        closest = colours[indices]
+        closest[unique[:, -1] == 0] = self.replace_transparent
+
+        self.metrics.count(cells = len(inverse), target_colours = len(unique))
+
+        return Image.fromarray(
+            closest[inverse].reshape(height, width, len(self.type)),
+            self.type
+        )
+
+
+
+    def generate_new_image_numpy(self, image: Image, pixels: tuple = None) -> None:
+        '''
+        same as `generate_new_image`, but matches all the unique colours \
+        of the resized `image` at once using `numpy`.
+
+        `pixels` are the unique pixels of `image`, if already known
+        '''
+
+        unique, inverse = unique_pixels(image) if pixels is None else pixels
+
+        colours = list(self.list_of_colours)
+        indices = self.match_colours(unique, self.show_progress_bar)
+
+        if not self.colour_lut and len(colours) >= INDEX_THRESHOLD:
+            self.log_index_times()
+
+        # same check as `generate_new_image`, the last channel
+        # of a pixel equal to 0 means it's transparent
+
+        closest = [
+            0 if transparent else colours[index]
+            for transparent, index in zip(
+                (unique[:, -1] == 0).tolist(),
+                indices
+            )
+        ]
+
+        self.new_image_colours = [closest[i] for i in inverse.tolist()]
+
+        self.metrics.count(
+            cells = len(inverse),
+            target_colours = len(unique),
+            cache_hits = len(inverse) - len(unique)
+        )
+
+
+
+    def generate_spread_image(self, image: Image, pixels: tuple = None) -> None:
+        '''
+        same as `generate_new_image`, but each tile is used \
+        at most `self.max_uses` times and never repeated closer \
+        than `self.min_spacing` cells, choosing among the closest \
+        `self.candidates` colours of each cell.
+
+        `pixels` are the unique pixels of `image`, if already known
+        '''
+
+        colours = list(self.list_of_colours)
+
+        if HAS_NUMPY:
+            unique, inverse = unique_pixels(image) if pixels is None else pixels
+
+            ids = np.arange(len(unique))
+            ids[unique[:, -1] == 0] = -1
+
+            cells = ids[inverse].tolist()
+        else:
+            ids = {}
+            cells = []
+
+            for i in image.getdata():
+                if i[-1] == 0:
+                    cells.append(-1)
+                else:
+                    cells.append(ids.setdefault(i, len(ids)))
+
+            unique = list(ids)
+
+        filled = len(cells) - cells.count(-1)
+
+        # the first colour is the one of transparent pixels, not a tile
+
+        tiles = len(colours) - 1
+
+        if self.max_uses and self.max_uses * tiles < filled:
+            print(
+                f'{tiles} tiles used at most {self.max_uses} times '
+                f'can\'t fill {filled} cells'
+            )
+            raise ValueError
+
+        candidates, distances = self.nearest_colours(unique, self.candidates)
+
+        indices, retries, relaxed = spread_tiles(
+            cells,
+            self.new_size[0],
+            candidates,
+            distances,
+            tiles,
+            self.max_uses,
+            self.min_spacing,
+            colours[1:],
+            unique
+        )
+
+        self.new_image_colours = [0 if i < 0 else colours[i + 1] for i in indices]
+
+        if self.log:
+            print(f'\t{retries} tiles already taken, {relaxed} cells out of candidates')
+
+        self.metrics.count(
+            cells = len(cells),
+            target_colours = len(unique),
+            tiles_taken = retries,
+            cells_relaxed = relaxed
+        )
+
+
+
+    def nearest_colours(self, colours, k: int) -> tuple:
+        '''
+        returns the indices of the `k` closest tiles to each of `colours`, \
+        closest first, and their distances, from `closest_k_indices` or, \
+        if there are too many tiles or there's no `numpy`, from the index.
+
+        tiles are `self.list_of_colours` without the first colour, \
+        that of transparent pixels, so index `i` is the colour `i + 1`
+        '''
+
+        if HAS_NUMPY and len(self.list_of_colours) < INDEX_THRESHOLD:
+            palette = np.array(list(self.list_of_colours)[1:], dtype = np.float32)[:, :3]
+
+            return closest_k_indices(palette, colours, k)
+
+        if HAS_NUMPY:
+            colours = colours.tolist()
+
+        # the index has the transparent colour too, so one more is asked for
+
+        nearest = [
+            [(diff, index - 1) for diff, index in self.colour_index.query_k(i, k + 1) if index][:k]
+            for i in colours
+        ]
+
+        self.log_index_times()
+
+        return (
+            [[index for _, index in i] for i in nearest],
+            [[diff for diff, _ in i] for i in nearest]
+        )
+
+
+
+    def match_colours(self, colours, show_progress_bar: bool = False) -> list:
+        '''
+        returns the index in `self.list_of_colours` of the closest colour \
+        to each of the `(n, channels)` uint8 array `colours`, using \
+        the lookup table, the index or `closest_indices`, \
+        whichever is the fastest
+        '''
+
+        if self.colour_lut:
+            return self.colour_lut.lookup(colours).tolist()
+
+        if len(self.list_of_colours) >= INDEX_THRESHOLD:
+            return self.colour_index.query_many(colours.tolist())
+
+        progress_bar = progress_bar_func(
+            ceil(len(colours) / closest_chunks(len(self.list_of_colours))),
+            show_progress_bar
+        )
+
+        indices = closest_indices(
+            list(self.list_of_colours),
+            colours,
+            progress_bar = progress_bar
+        ).tolist()
+
+        progress_bar.end()
+
+        return indices
+
+
+
+    def build_index(self) -> None:
+        '''
+        builds the nearest colour index over `self.list_of_colours`
+        '''
+
+        self.colour_index = ColourIndex(self.list_of_colours)
+
+        if self.lut_bits is not None:
+            self.build_lut()
+
+
+
+    def build_lut(self) -> None:
+        '''
+        loads the colour lookup table from `self.lut_path` if it was built \
+        from the same colours, otherwise builds it and saves it there.
+
+        if `self.lut_path` isn't set, the table is kept with the tiles \
+        of `self.library`, if set
+        '''
+
+        start = perf_counter()
+        colours = list(self.list_of_colours)
+
+        if not self.lut_path and self.library_index:
+            self.lut_path = f'{self.library_index.path}/lut_{self.lut_bits}.npy'
+
+        if self.lut_path:
+            self.colour_lut = ColourLUT.load(self.lut_path, colours)
+
+            if self.colour_lut and self.colour_lut.bits == self.lut_bits:
+                if self.log:
+                    print(
+                        f'\tcolour table loaded from \'{self.lut_path}\' '
+                        f'in {perf_counter() - start:.3f}s'
+                    )
+
+                return
+
+        side = 1 << self.lut_bits
+
+        progress_bar = progress_bar_func(
+            ceil(side / ColourLUT.block) ** 3,
+            self.show_progress_bar
+        )
+
+        self.colour_lut = ColourLUT.build(colours, self.lut_bits, progress_bar)
+
+        progress_bar.end()
+
+        if self.lut_path:
+            self.colour_lut.save(self.lut_path, colours)
+
+        if self.log:
+            print(
+                f'\tcolour table of {side}x{side}x{side} cells '
+                f'built in {perf_counter() - start:.3f}s'
+            )
+
+
+
+    def log_index_times(self) -> None:
+        '''
+        prints how long it took to build and query `self.colour_index`
+        '''
+
+        if self.log:
+            print(
+                f'\tindex of {len(self.colour_index)} colours built in '
+                f'{self.colour_index.build_time:.3f}s, '
+                f'{self.colour_index.queries} queries in '
+                f'{self.colour_index.query_time:.3f}s'
+            )
+
+
+
+    def get_closest_colour(
+            self,
+            colours: list,
+            colour: tuple
+        ) -> tuple:
+        '''
+        returns an `(r, g, b)` tuple of the closests colour \
+        to the given `colour` from a given list of `colours`
+        '''
+
+        min_diff = 200000
+        final_colour = 0
+
+        red, green, blue = colour[:3]
+
+        for i in colours:
+            i_red, i_green, i_blue = i[:3]
+
+            diff_1, diff_2, diff_3 = red - i_red, green - i_green, blue - i_blue
+            colour_diff = diff_1 * diff_1 + diff_2 * diff_2 + diff_3 * diff_3
+
+            if colour_diff < min_diff:
+                min_diff = colour_diff
+                final_colour = i
+
+        return final_colour
+
+
+
+    def get_first_available(
+            self,
+            file_name: str,
+            ext: str,
+
+            sep: str = '_',
+            start_num: int = 1,
+            format_digits: int = 1,
+            check_without: bool = True
+        ) -> str:
+        '''
+        returns the first name that is not already used in th current dir.
+
+        for example, if in the current directory you have:\n
+        - file.txt
+        - file_1.txt
+        - file-1.txt
+        - file_2.txt
+
+        ```py
+        self.get_first_available('file', 'txt')
+        ```
+
+        will return `file_3.txt`, whereas
+
+        ```py
+        self.get_first_available('file', 'txt', sep = '-')
+        ```
+
+        will return `file-2.txt`
+        '''
+
+        ext = '.' + ext if ext else ext
+
+        *folder, file_name = file_name.replace('\\', '/').split('/')
+        folder = '/'.join(folder)
+
+        if folder:
+            folder += '/'
+            files = os.listdir(folder)
+        else:
+            files = os.listdir()
+
+        if check_without:
+            if file_name + ext not in files:
+                return folder + file_name + ext
+
+        count = start_num
+        num = str(count).zfill(format_digits)
+        file_name_count = file_name + sep + num + ext
+
+        while file_name_count in files:
+            count += 1
+            num = str(count).zfill(format_digits)
+            file_name_count = file_name + sep + num + ext
+
+        return folder + file_name_count
+
+
+
+    def create_mosaic(self) -> Image:
+        '''
+        creates the final image pasting all \
+        the valid frames from `self.new_image_colours`
+        '''
+
+        if HAS_NUMPY:
+            return self.create_mosaic_numpy()
+
+        keys = {colour: key for key, colour in self.result.items()}
+
+        new_im = Image.new(
+            self.type,
+            self.get_output_size(),
+            self.replace_transparent
+        )
+
+        positions = self.get_positions()
+
+        self.metrics.count(cells = len(self.new_image_colours), tiles = len(positions))
+
+        progress_bar = progress_bar_func(len(positions), self.show_progress_bar)
+
+        for colour, places in positions.items():
+            img = self.atlas.image(keys[colour])
+
+            for k in places:
+                new_im.paste(
+                    img,
+                    (
+                        (k % self.new_size[0]) * self.size,
+                        (k // self.new_size[0]) * self.size
+                    )
+                )
+
+            img.close()
+
+            progress_bar.update()
+
+        progress_bar.end()
+
+        return new_im
+
+
+
+    def create_mosaic_numpy(self) -> Image:
+        '''
+        same as `create_mosaic`, but copies whole rows of tiles at once \
+        from `self.atlas` into a preallocated array, \
+        or, if `self.workers` isn't `1`, into shared memory \
+        with `self.workers` processes, see `compose_image`
+        '''
+
+        cells, tiles = self.get_cells()
+
+        self.metrics.count(cells = cells.size, tiles = len(tiles) - 1)
+
+        if self.workers != 1 and HAS_SHARED_MEMORY and self.new_size[1] > self.band_rows:
+            progress_bar = progress_bar_func(
+                ceil(self.new_size[1] / self.band_rows),
+                self.show_progress_bar
+            )
+
+            new_im = compose_image(
+                cells,
+                tiles,
+                self.type,
+                self.workers,
+                self.band_rows,
+                progress_bar
+            )
+
+            progress_bar.end()
+
+            return new_im
+
+        width, height = self.get_output_size()
+
+        new_im = np.empty((height, width, len(self.type)), dtype = np.uint8)
+
+        progress_bar = progress_bar_func(self.new_size[1], self.show_progress_bar)
+
+        for row in range(self.new_size[1]):
+            new_im[row * self.size:(row + 1) * self.size] = self.render_rows(
+                cells,
+                tiles,
+                row,
+                row + 1
+            )
+
+            progress_bar.update()
+
+        progress_bar.end()
+
+        return Image.fromarray(new_im, self.type)
+
+
+
+    def get_positions(self) -> dict:
+        '''
+        returns the positions of each colour in `self.new_image_colours`, \
+        skipping transparent cells and cells matched to the transparent colour
+        '''
+
+        positions = {}
+
+        for position, colour in enumerate(self.new_image_colours):
+            if colour in positions:
+                positions[colour].append(position)
+            else:
+                positions[colour] = [position]
+
+        # cells matched to the transparent colour are left as they are,
+        # and it may not be `self.replace_transparent` if that was
+        # changed after the frames were processed, see `TileLibrary`
+
+        positions.pop(0, None)
+        positions.pop(self.replace_transparent, None)
+        positions.pop(self.result[0], None)
+
+        return positions
+
+
+
+    def get_cells(self) -> tuple:
+        '''
+        returns a `(rows, columns)` array with the index, for each cell, \
+        of its tile in the `(n, size, size, channels)` array of used tiles, \
+        where the tile at index `0` is filled with the transparent colour
+        '''
+
+        keys = {colour: key for key, colour in self.result.items()}
+
+        # see `get_positions` for the colour of `self.result[0]`
+
+        indices = {0: 0, self.replace_transparent: 0, self.result[0]: 0}
+        rows = []
+
+        for colour in self.new_image_colours:
+            if colour not in indices:
+                indices[colour] = len(rows) + 1
+                rows.append(self.atlas.rows[keys[colour]])
+
+        cells = np.array(
+            [indices[colour] for colour in self.new_image_colours],
+            dtype = np.intp
+        ).reshape(self.new_size[1], self.new_size[0])
+
+        tiles = np.empty(
+            (len(rows) + 1, self.size, self.size, len(self.type)),
+            dtype = np.uint8
+        )
+
+        tiles[0] = self.replace_transparent
+        tiles[1:] = self.atlas.array()[rows]
+
+        return cells, tiles
+
+
+
+    def get_palette_tiles(self):
+        '''
+        same as `get_cells`, but returns the tiles of all the colours \
+        in `self.list_of_colours`, in the same order, for when cells \
+        aren't known in advance, like in `render_video`
+        '''
+
+        rows = [self.atlas.rows[key] for key in list(self.result)[1:]]
+
+        tiles = np.empty(
+            (len(rows) + 1, self.size, self.size, len(self.type)),
+            dtype = np.uint8
+        )
+
+        tiles[0] = self.replace_transparent
+        tiles[1:] = self.atlas.array()[rows]
+
+        return tiles
+
+
+
+    def render_rows(self, cells, tiles, start: int, end: int):
+        '''
+        returns the pixels of the rows of cells from `start` to `end`, \
+        as a `((end - start) * size, columns * size, channels)` array
+        '''
+
+        return render_rows(cells, tiles, start, end)
+
+
+
+    def save(self, image: Image) -> None:
+        '''
+        saves `image` as `self.output_file_name`, see `save_image`, \
+        and prints how long it took and how big the file is
+        '''
+
+        file_name = self.get_output_file_name()
+
+        start = perf_counter()
+
+        save_image(
+            image,
+            file_name,
+            self.compression_level,
+            self.save_preset,
+            self.workers
+        )
+
+        elapsed = perf_counter() - start
+        written = os.path.getsize(file_name)
+
+        self.metrics.count(bytes_written = written)
+
+        if self.log:
+            print(
+                f'\t{written / 1e6:.1f} MB in {elapsed:.3f}s, '
+                f'{image.size[0] * image.size[1] / 1e6 / elapsed:.1f} megapixels/s'
+            )
+
+
+
+    def save_stream(self) -> None:
+        '''
+        creates the mosaic in bands of `self.band_rows` rows of frames \
+        and writes each band in the output file as soon as it's ready, \
+        so the whole image is never in memory
+        '''
+
+        cells, tiles = self.get_cells()
+
+        file_name = self.get_output_file_name()
+
+        # bands already written are kept, if the checkpoint has them
+
+        state = self.render_job.get('bands') if self.render_job else None
+
+        if state and not os.path.exists(file_name):
+            state = None
+
+        writer = open_writer(
+            file_name,
+            self.get_output_size(),
+            self.type,
+            self.get_compression_level(),
+            state and state['writer']
+        )
+
+        # the checkpoint must wait for each band to be written
+
+        if self.pipeline and not self.render_job:
+            writer = BackgroundWriter(writer)
+
+        rows = self.new_size[1]
+        first = state['start'] if state else 0
+
+        progress_bar = progress_bar_func(
+            ceil((rows - first) / self.band_rows),
+            self.show_progress_bar
+        )
+
+        for start in range(first, rows, self.band_rows):
+            writer.write(self.render_rows(
+                cells,
+                tiles,
+                start,
+                min(start + self.band_rows, rows)
+            ))
+
+            if self.render_job:
+                self.render_job.set('bands', {
+                    'start': start + self.band_rows,
+                    'writer': writer.checkpoint()
+                })
+
+            progress_bar.update()
+
+        writer.close()
+        progress_bar.end()
+
+        self.metrics.count(cells = cells.size, bytes_written = os.path.getsize(file_name))
+
+
+
+    def create_and_save(self) -> Image:
+        '''
+        same as `create_mosaic` and `save`, but each band of \
+        `self.band_rows` rows of frames is written, in a thread, \
+        as soon as it's created, while the next ones are. \
+        see `BackgroundWriter`.
+
+        both run on one thread each, so `render` uses it \
+        only if `self.workers` is `1`
+        '''
+
+        cells, tiles = self.get_cells()
+
+        file_name = self.get_output_file_name()
+
+        width, height = self.get_output_size()
+
+        new_im = np.empty((height, width, len(self.type)), dtype = np.uint8)
+
+        writer = BackgroundWriter(open_writer(
+            file_name,
+            (width, height),
+            self.type,
+            self.get_compression_level()
+        ))
+
+        rows = self.new_size[1]
+
+        progress_bar = progress_bar_func(
+            ceil(rows / self.band_rows),
+            self.show_progress_bar
+        )
+
+        for start in range(0, rows, self.band_rows):
+            end = min(start + self.band_rows, rows)
+
+            # the band is a view of `new_im`, never written again
+
+            band = new_im[start * self.size:end * self.size]
+            band[:] = self.render_rows(cells, tiles, start, end)
+
+            writer.write(band)
+
+            progress_bar.update()
+
+        writer.close()
+        progress_bar.end()
+
+        self.metrics.count(
+            cells = cells.size,
+            tiles = len(tiles) - 1,
+            bytes_written = os.path.getsize(file_name)
+        )
+
+        return Image.fromarray(new_im, self.type)
+
+
+
+    def save_pyramid(self) -> None:
+        '''
+        writes the mosaic as a Deep Zoom pyramid, see `write_pyramid`, \
+        without ever creating the whole image
+        '''
+
+        cells, tiles = self.get_cells()
+
+        file_name = self.get_output_file_name()
+
+        progress_bar = progress_bar_func(
+            (max(self.get_output_size()) - 1).bit_length() + 1,
+            self.show_progress_bar
+        )
+
+        write_pyramid(
+            file_name,
+            cells,
+            tiles,
+            self.type,
+            self.dzi_tile_size,
+            tile_format = self.dzi_format,
+            progress_bar = progress_bar
+        )
+
+        progress_bar.end()
+
+        written = os.path.getsize(file_name)
+
+        for folder, _, files in os.walk(file_name[:-len('.dzi')] + '_files'):
+            written += sum(os.path.getsize(f'{folder}/{i}') for i in files)
+
+        self.metrics.count(cells = cells.size, bytes_written = written)
+
+
+
+    def is_pyramid(self) -> bool:
+        '''
+        returns whether the output is a `.dzi` Deep Zoom pyramid
+        '''
+
+        return bool(self.output_file_name) and self.output_file_name.lower().endswith('.dzi')
+
+
+
+    def get_compression_level(self) -> int:
+        '''
+        returns the zlib level of `self.save_preset`, if set, \
+        otherwise `self.compression_level`
+        '''
+
+        return ENCODE_PRESETS.get(self.save_preset, {}).get('level', self.compression_level)
+
+
+
+    def get_extension(self) -> str:
+        '''
+        returns the extension of `self.output_file_name`, lowercase
+        '''
+
+        return self.output_file_name.split('.')[-1].lower()
+
+
+
+    def get_output_file_name(self) -> str:
+        '''
+        returns the first available name for the output file, \
+        or the one chosen before if the mosaic has a checkpoint
+        '''
+
+        if self.render_job and self.render_job.done('output'):
+            self.output_path = self.render_job.get('output')
+
+            return self.output_path
+
+        file_name = self.get_first_available(
+            '.'.join(self.output_file_name.split('.')[:-1]),
+            self.output_file_name.split('.')[-1]
+        )
+
+        if self.render_job:
+            self.render_job.set('output', file_name)
+
+        # what was actually written, `output_file_name` may have existed
+
+        self.output_path = file_name
+
+        return file_name
+
 
 
     def clear_files(self, files: list):
@@ -529,7 +2106,7 @@ class MOSAIC:
         for i in files:
             try:
                 os.remove(i)
-            except PermissionError:
+            except OSError:
                 shutil.rmtree(i, ignore_errors = True)
 
 
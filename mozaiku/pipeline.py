@@ -0,0 +1,109 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading          import Thread
+from queue              import Queue
+
+
+
+__all__ = [
+    'BackgroundWriter',
+    'QUEUE_SIZE',
+    'in_background'
+]
+
+
+
+# bands waiting to be written at most, so that a slow encoder
+# doesn't let finished bands pile up in memory
+
+QUEUE_SIZE = 4
+
+
+
+## =============== BACKGROUND TASKS =============== ##
+
+
+
+def in_background(func, *args, **kwargs):
+    '''
+    starts calling `func` with `args` and `kwargs` in a thread \
+    and returns its `Future`, whose `result` waits for it \
+    and raises what it raised
+    '''
+
+    executor = ThreadPoolExecutor(1)
+    future = executor.submit(func, *args, **kwargs)
+
+    # the thread ends as soon as `func` returns
+
+    executor.shutdown(wait = False)
+
+    return future
+
+
+
+## =============== BACKGROUND WRITER =============== ##
+
+
+
+class BackgroundWriter:
+    '''
+    wraps one of the writers of `open_writer`, so that bands \
+    are written, and compressed, in a thread while the next ones \
+    are created. `zlib` releases the GIL, so both really run at once.
+
+    `write` waits only when `queue_size` bands are already waiting
+    '''
+
+    def __init__(self, writer, queue_size: int = QUEUE_SIZE) -> None:
+        self.writer = writer
+        self.queue = Queue(queue_size)
+        self.error = None
+
+        self.thread = Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+
+
+    def run(self) -> None:
+        while True:
+            band = self.queue.get()
+
+            if band is None:
+                break
+
+            # after an error, bands are only taken out of the queue,
+            # so `write` never waits forever
+
+            if self.error is None:
+                try:
+                    self.writer.write(band)
+                except BaseException as error:
+                    self.error = error
+
+
+
+    def write(self, band) -> None:
+        '''
+        queues the `(rows, width, channels)` uint8 array `band`, \
+        which must not be changed until it's written
+        '''
+
+        if self.error is not None:
+            raise self.error
+
+        self.queue.put(band)
+
+
+
+    def close(self) -> None:
+        '''
+        waits for the queued bands to be written and closes the writer
+        '''
+
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise self.error
+
+        self.writer.close()
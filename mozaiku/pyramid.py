@@ -0,0 +1,292 @@
+from math   import ceil
+from PIL    import Image
+
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'DZI_FORMATS',
+    'write_pyramid'
+]
+
+
+
+# formats of the images of the pyramid
+
+DZI_FORMATS = ('jpg', 'png')
+
+DZI_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="{}" Overlap="{}" TileSize="{}">
+  <Size Width="{}" Height="{}"/>
+</Image>
+'''
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def to_image(pixels) -> Image:
+    '''
+    returns the `(height, width, channels)` uint8 array `pixels` as a PIL image
+    '''
+
+    height, width, channels = pixels.shape
+
+    return Image.frombytes(
+        {1: 'L', 2: 'LA', 3: 'RGB', 4: 'RGBA'}[channels],
+        (width, height),
+        np.ascontiguousarray(pixels).tobytes()
+    )
+
+
+
+def cell_map(cells: int, size: int, shift: int) -> tuple:
+    '''
+    returns, for each pixel along one side of the level `shift` times \
+    smaller than the mosaic, the cell it belongs to and its offset \
+    in that cell, then the size of each cell in pixels.
+
+    the pixel `x` of the level belongs to the cell holding the pixel \
+    `x << shift` of the mosaic, so each cell is either `size >> shift` \
+    or one more pixel wide and the level is `ceil(cells * size / 2 ** shift)` wide, \
+    like Deep Zoom expects
+    '''
+
+    starts = -(-(np.arange(cells + 1) * size) >> shift)
+
+    pixel = np.arange(starts[-1])
+    cell = np.minimum((pixel << shift) // size, cells - 1)
+
+    return cell, pixel - starts[cell], np.diff(starts)
+
+
+
+def downsample(tiles, heights: list, widths: list):
+    '''
+    returns the tiles resized to every height of `heights` and width \
+    of `widths`, as a `(n, len(heights), len(widths), max(heights), \
+    max(widths), channels)` array, from `tiles`, an array like that \
+    whose last variant is the biggest
+    '''
+
+    n, _, _, _, _, channels = tiles.shape
+
+    # the biggest variant is the most detailed
+
+    source = tiles[:, -1, -1]
+
+    result = np.zeros(
+        (n, len(heights), len(widths), max(heights), max(widths), channels),
+        dtype = np.uint8
+    )
+
+    for i, tile in enumerate(source):
+        image = to_image(tile)
+
+        for y, height in enumerate(heights):
+            for x, width in enumerate(widths):
+                result[i, y, x, :height, :width] = np.asarray(
+                    image.resize((width, height), Image.BOX)
+                ).reshape(height, width, channels)
+
+    return result
+
+
+
+def level_renderer(cells, variants, column, x_offset, x_variant, row, y_offset, y_variant):
+    '''
+    returns the function returning the pixels from `(x0, y0)` to `(x1, y1)` \
+    of a level, given the tiles resized by `downsample` \
+    and the `cell_map` of the columns and rows of the level
+    '''
+
+    def render(x0: int, y0: int, x1: int, y1: int):
+        c = column[x0:x1]
+        r = row[y0:y1, None]
+
+        return variants[
+            cells[r, c],
+            y_variant[r],
+            x_variant[c],
+            y_offset[y0:y1, None],
+            x_offset[x0:x1]
+        ]
+
+    return render
+
+
+
+def halving_renderer(render, shift: int, width: int, height: int):
+    '''
+    returns the function returning the pixels from `(x0, y0)` to `(x1, y1)` \
+    of the level half as big as the level `shift` times smaller \
+    than the `width` by `height` mosaic, whose pixels are given by `render`.
+
+    each pixel is the average of four pixels of that level, weighted \
+    by how many pixels of the mosaic they cover, since the last row \
+    and column of a level can cover less than the others
+    '''
+
+    def weights(start: int, end: int, length: int):
+        pixel = np.arange(start, end)
+
+        return np.minimum((pixel + 1) << shift, length) - (pixel << shift)
+
+    def block(x0: int, y0: int, x1: int, y1: int):
+        x1, y1 = min(2 * x1, -(-width >> shift)), min(2 * y1, -(-height >> shift))
+        x0, y0 = 2 * x0, 2 * y0
+
+        pixels = render(x0, y0, x1, y1)
+
+        # odd levels get a last row and column that weigh nothing
+
+        rows, columns = -(-len(pixels) // 2) * 2, -(-pixels.shape[1] // 2) * 2
+
+        weight = np.zeros((rows, columns, 1))
+        weight[:y1 - y0, :x1 - x0, 0] = np.outer(weights(y0, y1, height), weights(x0, x1, width))
+
+        total = np.zeros((rows, columns, pixels.shape[2]))
+        total[:y1 - y0, :x1 - x0] = pixels * weight[:y1 - y0, :x1 - x0]
+
+        total = total.reshape(rows // 2, 2, columns // 2, 2, -1).sum(axis = (1, 3))
+        weight = weight.reshape(rows // 2, 2, columns // 2, 2, 1).sum(axis = (1, 3))
+
+        return np.round(total / weight).astype(np.uint8)
+
+    return block
+
+
+
+def array_renderer(pixels):
+    '''
+    returns the function returning the pixels from `(x0, y0)` to `(x1, y1)` \
+    of the whole level `pixels`
+    '''
+
+    def block(x0: int, y0: int, x1: int, y1: int):
+        return pixels[y0:y1, x0:x1]
+
+    return block
+
+
+
+## =============== DEEP ZOOM PYRAMID =============== ##
+
+
+
+def write_pyramid(
+        path: str,
+        cells,
+        tiles,
+        mode: str,
+
+        tile_size: int = 254,
+        overlap: int = 1,
+        tile_format: str = 'jpg',
+        progress_bar = None
+    ) -> None:
+    '''
+    writes the mosaic made of the `(n, size, size, channels)` `tiles`, \
+    placed as in the `(rows, columns)` `cells` array, like those \
+    from `MOSAIC.get_cells`, as the Deep Zoom image `path`, \
+    a `.dzi` file with the images of each level next to it \
+    in the `_files` folder, so that a viewer like OpenSeadragon \
+    loads only the part of the mosaic that is shown.
+
+    the mosaic is never whole in memory, \
+    each image of the pyramid is built from `cells` and `tiles`, \
+    downsampled once for each level. levels whose cells are smaller \
+    than a pixel are small enough to be made whole, \
+    halving the previous one
+
+    ## Optional Parameters
+    - `tile_size`, `overlap`:\n
+      - the size of the images of the pyramid \
+      and how many pixels they share with their neighbours
+    - `tile_format`:\n
+      - one of `DZI_FORMATS`
+    - `progress_bar`:\n
+      - updated once for each level
+    '''
+
+    rows, columns = cells.shape
+    size = tiles.shape[1]
+
+    width, height = columns * size, rows * size
+    levels = (max(width, height) - 1).bit_length() + 1
+
+    folder = path[:-len('.dzi')] + '_files'
+
+    # alpha is dropped for formats that don't support it
+
+    if tile_format == 'jpg' and mode in ('LA', 'RGBA'):
+        mode = mode[:-1]
+
+    # `variants` holds the tiles at the size of the cells of the current level
+
+    variants = tiles[:, None, None]
+    previous = None
+
+    for shift in range(levels):
+        level = levels - 1 - shift
+        level_path = f'{folder}/{level}'
+
+        os.makedirs(level_path, exist_ok = True)
+
+        level_width = max(1, -(-width >> shift))
+        level_height = max(1, -(-height >> shift))
+
+        if size >> shift:
+            column, x_offset, widths = cell_map(columns, size, shift)
+            row, y_offset, heights = cell_map(rows, size, shift)
+
+            widths, x_variant = np.unique(widths, return_inverse = True)
+            heights, y_variant = np.unique(heights, return_inverse = True)
+
+            if shift:
+                variants = downsample(variants, heights.tolist(), widths.tolist())
+
+            render = level_renderer(cells, variants, column, x_offset, x_variant, row, y_offset, y_variant)
+
+            # cells that aren't a whole number of pixels share pixels with their
+            # neighbours, so the level is rendered twice as big and halved
+
+            if size % (1 << shift) and previous:
+                block = halving_renderer(*previous, width, height)
+            else:
+                block = render
+
+            previous = render, shift
+        else:
+            # cells are smaller than a pixel, so the level is smaller than
+            # the image the mosaic was made from, and it's made whole
+
+            small = halving_renderer(*previous, width, height)(0, 0, level_width, level_height)
+
+            block = array_renderer(small)
+            previous = block, shift
+
+        for y in range(ceil(level_height / tile_size)):
+            for x in range(ceil(level_width / tile_size)):
+                x0 = max(0, x * tile_size - overlap)
+                y0 = max(0, y * tile_size - overlap)
+                x1 = min(level_width, (x + 1) * tile_size + overlap)
+                y1 = min(level_height, (y + 1) * tile_size + overlap)
+
+                to_image(block(x0, y0, x1, y1)).convert(mode).save(
+                    f'{level_path}/{x}_{y}.{tile_format}'
+                )
+
+        if progress_bar:
+            progress_bar.update()
+
+    with open(path, 'w', encoding = 'utf-8') as f:
+        f.write(DZI_XML.format(tile_format, overlap, tile_size, width, height))
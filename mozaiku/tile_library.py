@@ -0,0 +1,317 @@
+from PIL        import Image
+
+from .mosaic    import MOSAIC
+from .utils     import log_func
+
+import copy
+import os
+
+
+
+__all__ = [
+    'TileLibrary'
+]
+
+
+
+## =============== TILE LIBRARY =============== ##
+
+
+
+class TileLibrary:
+    '''
+    frames of a YouTube `url`, a `video_path` video or \
+    a `folder_path` folder, resized to `frames_size` and ready \
+    to be used for any number of photo mosaics with `render`.
+
+    frames are extracted, resized and indexed only once, \
+    when the library is created, so each `render` only matches \
+    the colours of its image and creates the mosaic
+
+    ```py
+    library = mozaiku.TileLibrary(20, folder_path = 'frames')
+
+    for i in os.listdir('portraits'):
+        library.render(f'portraits/{i}', f'mosaics/{i}', 100)
+    ```
+
+    more frames can be added later with `append`
+
+    ## Optional Parameters
+    - `mode`:\n
+      - the mode of the mosaics, images are converted to it. \
+      use `RGBA` to keep transparency
+    - `frames_are_already_squares`:\n
+      - skip the step of cropping all frames to square
+    - `**options`:\n
+      - any other optional parameter of `MOSAIC`, \
+      like `fps`, `workers`, `library` or `lut_bits`
+    '''
+
+    # options that can change for each mosaic, the others are those
+    # the frames were got with, or internals of `MOSAIC`
+
+    render_options = (
+        'log',
+        'clear',
+        'compression_level',
+        'show_progress_bar',
+        'replace_transparent',
+        'workers',
+        'stream',
+        'band_rows',
+        'dzi_tile_size',
+        'dzi_format',
+        'metrics',
+        'max_uses',
+        'min_spacing',
+        'candidates',
+        'pipeline',
+        'checkpoint',
+        'preview',
+        'save_preset'
+    )
+
+    def __init__(
+            self,
+            frames_size: int,
+
+            url: str = None,
+            video_path: str = None,
+            folder_path: str = None,
+
+            mode: str = 'RGB',
+            frames_are_already_squares: bool = False,
+            **options
+        ) -> None:
+
+        self.mosaic = MOSAIC(
+            image_path = None,
+            output_file_name = None,
+            sample_image = None,
+            image_max_size = None,
+            frames_size = frames_size,
+
+            url = url,
+            video_path = video_path,
+            folder_path = folder_path,
+            mode = mode,
+            **options
+        )
+
+        if url:
+            self.mosaic.ingest_youtube()
+        elif video_path:
+            self.mosaic.ingest_video()
+        else:
+            self.mosaic.ingest_folder(frames_are_already_squares)
+
+        self.options = options
+
+        # the time spent getting the frames, renders have their own metrics
+
+        self.metrics = self.mosaic.metrics
+
+        # the tiles are all in memory or in the tile library by now
+
+        if self.mosaic.clear:
+            self.mosaic.clear_files(self.mosaic.to_clear)
+            self.mosaic.to_clear = []
+
+
+
+    def __len__(self) -> int:
+        '''
+        returns the number of different tiles
+        '''
+
+        return len(self.mosaic.result) - 1
+
+
+
+    def append(
+            self,
+            url: str = None,
+            video_path: str = None,
+            folder_path: str = None,
+
+            frames_are_already_squares: bool = False
+        ) -> int:
+        '''
+        adds the frames of another YouTube `url`, `video_path` video \
+        or `folder_path` folder to the library, processing only them, \
+        and returns how many tiles were added, see `MOSAIC.append_tiles`.
+
+        keys of the tiles already in the library don't change
+
+        ```py
+        library = mozaiku.TileLibrary(20, folder_path = 'frames')
+        library.append(video_path = 'new.mp4')
+        ```
+        '''
+
+        # the same options, so the new frames go in their own
+        # tile library too, if `library` is set
+
+        other = TileLibrary(
+            self.mosaic.frames_size,
+            url,
+            video_path,
+            folder_path,
+
+            self.mosaic.type,
+            frames_are_already_squares,
+            **{**self.options, 'metrics': self.metrics}
+        )
+
+        return log_func(
+            self.mosaic.append_tiles,
+            'Adding frames',
+            self.mosaic.log,
+            other.mosaic,
+            metrics = self.metrics
+        )
+
+
+
+    def render(
+            self,
+            image_path: str,
+            output_file_name: str,
+            image_max_size: int,
+
+            **options
+        ) -> Image:
+        '''
+        creates the photo mosaic of the `image_path` image \
+        and saves it as `output_file_name`, see `MOSAIC.render`.
+
+        `options` replace, for this mosaic only, the parameters \
+        given when the library was created, \
+        like `stream`, `compression_level` or `log`, \
+        see `render_options`. those the frames depend on, \
+        like `frames_size`, `mode` or `lut_bits`, can't change. \
+        pass `metrics` to read the metrics of this mosaic
+        '''
+
+        mosaic = self.get_mosaic(image_path, output_file_name, image_max_size, options)
+
+        mosaic.check_output()
+
+        return mosaic.render()
+
+
+
+    def preview(
+            self,
+            image_path: str,
+            image_max_size: int,
+
+            output_file_name: str = None,
+            **options
+        ) -> Image:
+        '''
+        returns how the mosaic of the `image_path` image will look, \
+        with one pixel of the colour of its tile for each tile, \
+        see `MOSAIC.create_preview`, and saves it as `output_file_name`, \
+        if given. it takes milliseconds, so parameters like \
+        `image_max_size` can be checked before calling `render`
+
+        ```py
+        library.preview('portrait.jpg', 100).resize((1000, 1000), 0).show()
+        ```
+        '''
+
+        mosaic = self.get_mosaic(image_path, output_file_name, image_max_size, options)
+
+        if output_file_name:
+            mosaic.preview = True
+            mosaic.check_output()
+
+        img = mosaic.create_preview()
+
+        if output_file_name:
+            mosaic.save(img)
+
+        return img
+
+
+
+    def render_video(
+            self,
+            video_path: str,
+            output_file_name: str,
+            image_max_size: int,
+
+            threshold: float = 8,
+            **options
+        ) -> None:
+        '''
+        creates the photo mosaic of each frame of the `video_path` video \
+        and encodes them in the `output_file_name` video, \
+        see `MOSAIC.render_video`.
+
+        ```py
+        library = mozaiku.TileLibrary(20, folder_path = 'frames')
+        library.render_video('clip.mp4', 'mosaic.mp4', 80)
+        ```
+
+        ## Optional Parameters
+        - `threshold`:\n
+          - how far, in RGB, the colour of a cell must move from \
+          the colour it had when it was last matched to be matched again. \
+          `0` matches again every cell that changed at all
+        - `**options`:\n
+          - same as `render`
+        '''
+
+        mosaic = self.get_mosaic(video_path, output_file_name, image_max_size, options)
+
+        mosaic.render_video(threshold)
+
+
+
+    def get_mosaic(
+            self,
+            image_path: str,
+            output_file_name: str,
+            image_max_size: int,
+            options: dict
+        ) -> MOSAIC:
+        '''
+        returns a copy of the mosaic of the library, \
+        ready to render `image_path`
+        '''
+
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f'No such file or directory: \'{image_path}\'')
+
+        # a shallow copy shares tiles, colours and indexes with the library
+
+        mosaic = copy.copy(self.mosaic)
+
+        mosaic.image_path = image_path
+        mosaic.output_file_name = output_file_name
+        mosaic.image_max_size = image_max_size
+
+        # each mosaic has its own metrics, with the hooks of the library
+
+        mosaic.metrics = self.metrics.empty()
+
+        for name, value in options.items():
+            if name not in self.render_options:
+                raise TypeError(f'unexpected keyword argument \'{name}\'')
+
+            setattr(mosaic, name, value)
+
+        # a mosaic checkpointed somewhere else than the frames
+        # gets its own, see `MOSAIC.open_render_checkpoint`
+
+        if mosaic.checkpoint != self.mosaic.checkpoint:
+            mosaic.job = None
+
+        mosaic.replace_transparent = tuple(mosaic.replace_transparent)[:len(mosaic.type)]
+
+        mosaic.check_render_options()
+
+        return mosaic
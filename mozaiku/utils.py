@@ -9,17 +9,26 @@ __all__ = [
 
 
 
-def log_func(func, message, log, *args, **kwargs):
+def log_func(func, message, log, *args, metrics = None, **kwargs):
+    '''
+    calls `func` with `args` and `kwargs`, printing `message` before it \
+    and `Done.` after it if `log` is set, and measures it \
+    as a stage of `metrics`, named after `func`, if given
+    '''
+
     if log:
         print(message + '...')
 
+    if metrics is None:
         result = func(*args, **kwargs)
+    else:
+        with metrics.stage(func.__name__):
+            result = func(*args, **kwargs)
 
+    if log:
         print('\tDone.\n')
 
-        return result
-
-    return func(*args)
+    return result
 
 
 
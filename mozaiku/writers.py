@@ -0,0 +1,415 @@
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+
+__all__ = [
+    'STREAM_FORMATS',
+    'PNGWriter',
+    'TIFFWriter',
+    'open_writer',
+    'png_rows',
+    'sub_filter'
+]
+
+
+
+## =============== HELPERS =============== ##
+
+
+
+def sub_filter(band, channels: int):
+    '''
+    returns the `(rows, width * channels)` band with each byte replaced \
+    by its difference with the same byte of the previous pixel, \
+    which is what both the PNG `Sub` filter and the TIFF predictor `2` do
+    '''
+
+    band = band.reshape(len(band), -1)
+    filtered = band.copy()
+    filtered[:, channels:] -= band[:, :-channels]
+
+    return filtered
+
+
+
+def png_rows(band, channels: int) -> bytes:
+    '''
+    returns the rows of the `(rows, width, channels)` band \
+    as PNG scanlines, filtered with `sub_filter`
+    '''
+
+    filtered = sub_filter(band, channels)
+
+    # each row starts with its filter type, 1 is Sub
+
+    rows = np.empty((len(filtered), filtered.shape[1] + 1), dtype = np.uint8)
+    rows[:, 0] = 1
+    rows[:, 1:] = filtered
+
+    return rows.tobytes()
+
+
+
+## =============== WRITERS =============== ##
+
+
+
+class PNGWriter:
+    '''
+    writes a PNG image one band of rows at a time, \
+    compressing each band as soon as it's written.
+
+    the zlib header and checksum are written here and the bands \
+    as raw deflate data, so that a file left by `checkpoint` \
+    can be written on with a new compressor
+    '''
+
+    colour_types = {
+        'L': 0,
+        'LA': 4,
+        'RGB': 2,
+        'RGBA': 6
+    }
+
+    def __init__(
+            self,
+            path: str,
+            size: tuple,
+            mode: str,
+
+            compression_level: int = 6,
+            state: dict = None
+        ) -> None:
+
+        self.channels = len(mode)
+        self.compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15)
+
+        if state:
+            self.file = open(path, 'r+b')
+            self.file.truncate(state['position'])
+            self.file.seek(state['position'])
+
+            self.checksum = state['checksum']
+
+            return
+
+        self.file = open(path, 'wb')
+        self.checksum = zlib.adler32(b'')
+
+        self.file.write(b'\x89PNG\r\n\x1a\n')
+        self.chunk(b'IHDR', struct.pack(
+            '>IIBBBBB',
+            *size,
+            8,
+            self.colour_types[mode],
+            0, 0, 0
+        ))
+
+        # zlib header, deflate with the default window
+
+        self.chunk(b'IDAT', b'\x78\x9c')
+
+
+
+    def chunk(self, tag: bytes, data: bytes) -> None:
+        self.file.write(struct.pack('>I', len(data)) + tag + data)
+        self.file.write(struct.pack('>I', zlib.crc32(tag + data)))
+
+
+
+    def write(self, band) -> None:
+        '''
+        writes the `(rows, width, channels)` uint8 array `band`
+        '''
+
+        rows = png_rows(band, self.channels)
+
+        self.checksum = zlib.adler32(rows, self.checksum)
+
+        data = self.compressor.compress(rows)
+
+        if data:
+            self.chunk(b'IDAT', data)
+
+
+
+    def checkpoint(self) -> dict:
+        '''
+        writes everything written so far to the file and returns \
+        the `state` to give to a new writer to go on from here
+        '''
+
+        # a full flush ends the deflate data on a byte boundary
+        # that no later data refers back from
+
+        self.chunk(b'IDAT', self.compressor.flush(zlib.Z_FULL_FLUSH))
+        self.file.flush()
+
+        return {'position': self.file.tell(), 'checksum': self.checksum}
+
+
+
+    def close(self) -> None:
+        self.chunk(b'IDAT', self.compressor.flush() + struct.pack('>I', self.checksum))
+        self.chunk(b'IEND', b'')
+        self.file.close()
+
+
+
+class TIFFWriter:
+    '''
+    writes a striped TIFF image, one strip for each band of rows, \
+    each compressed with deflate as soon as it's written.
+
+    images that could be bigger than 4GB are written as BigTIFF
+    '''
+
+    def __init__(
+            self,
+            path: str,
+            size: tuple,
+            mode: str,
+
+            compression_level: int = 6,
+            state: dict = None
+        ) -> None:
+
+        self.size = size
+        self.mode = mode
+        self.channels = len(mode)
+        self.compression_level = compression_level
+
+        self.big = size[0] * size[1] * self.channels >= 1 << 32
+
+        self.rows_per_strip = None
+        self.offsets = []
+        self.byte_counts = []
+
+        if state:
+            self.rows_per_strip = state['rows_per_strip']
+            self.offsets = state['offsets']
+            self.byte_counts = state['byte_counts']
+
+            self.file = open(path, 'r+b')
+            self.file.truncate(state['position'])
+            self.file.seek(state['position'])
+
+            return
+
+        self.file = open(path, 'wb')
+
+        # the offset of the IFD is written at the end, in `close`
+
+        if self.big:
+            self.file.write(b'II+\x00' + struct.pack('<HHQ', 8, 0, 0))
+        else:
+            self.file.write(b'II*\x00' + struct.pack('<I', 0))
+
+
+
+    def write(self, band) -> None:
+        '''
+        writes the `(rows, width, channels)` uint8 array `band`
+        '''
+
+        self.write_strip(self.compress(band), len(band))
+
+
+
+    def compress(self, band) -> bytes:
+        '''
+        returns the strip of `band`, compressed. it doesn't change \
+        the writer, so strips can be compressed in many threads at once
+        '''
+
+        return zlib.compress(
+            sub_filter(band, self.channels).tobytes(),
+            self.compression_level
+        )
+
+
+
+    def write_strip(self, data: bytes, rows: int) -> None:
+        '''
+        writes the strip `data`, made by `compress`, of `rows` rows
+        '''
+
+        if self.rows_per_strip is None:
+            self.rows_per_strip = rows
+
+        self.offsets.append(self.file.tell())
+        self.byte_counts.append(len(data))
+        self.file.write(data)
+
+
+
+    def checkpoint(self) -> dict:
+        '''
+        same as `PNGWriter.checkpoint`
+        '''
+
+        self.file.flush()
+
+        return {
+            'position': self.file.tell(),
+            'rows_per_strip': self.rows_per_strip,
+            'offsets': self.offsets,
+            'byte_counts': self.byte_counts
+        }
+
+
+
+    def close(self) -> None:
+        offset_type = 16 if self.big else 4
+
+        entries = [
+            (256, 4, [self.size[0]]),                           # ImageWidth
+            (257, 4, [self.size[1]]),                           # ImageLength
+            (258, 3, [8] * self.channels),                      # BitsPerSample
+            (259, 3, [8]),                                      # Compression, deflate
+            (262, 3, [2 if self.channels > 2 else 1]),          # Photometric
+            (273, offset_type, self.offsets),                   # StripOffsets
+            (277, 3, [self.channels]),                          # SamplesPerPixel
+            (278, 4, [self.rows_per_strip or self.size[1]]),    # RowsPerStrip
+            (279, offset_type, self.byte_counts),               # StripByteCounts
+            (284, 3, [1]),                                      # PlanarConfiguration
+            (317, 3, [2])                                       # Predictor
+        ]
+
+        if self.mode in ('LA', 'RGBA'):
+            entries.append((338, 3, [2]))                       # ExtraSamples, alpha
+
+        if self.file.tell() % 2:
+            self.file.write(b'\x00')
+
+        if self.big:
+            head, entry, tail, slot = '<Q', '<HHQ', '<Q', 8
+        else:
+            head, entry, tail, slot = '<H', '<HHI', '<I', 4
+
+        ifd_offset = self.file.tell()
+        extra_offset = ifd_offset + struct.calcsize(head) + struct.calcsize(tail) + \
+            len(entries) * (struct.calcsize(entry) + slot)
+
+        ifd = struct.pack(head, len(entries))
+        extra = b''
+
+        for tag, type_, values in entries:
+            data = struct.pack('<' + {3: 'H', 4: 'I', 16: 'Q'}[type_] * len(values), *values)
+
+            if len(data) > slot:
+                ifd += struct.pack(entry, tag, type_, len(values))
+                ifd += struct.pack('<' + tail[1], extra_offset + len(extra))
+
+                extra += data + b'\x00' * (len(data) % 2)
+            else:
+                ifd += struct.pack(entry, tag, type_, len(values)) + data.ljust(slot, b'\x00')
+
+        self.file.write(ifd + struct.pack(tail, 0) + extra)
+
+        self.file.seek(8 if self.big else 4)
+        self.file.write(struct.pack(tail, ifd_offset))
+
+        self.file.close()
+
+
+
+class NPYWriter:
+    '''
+    writes the image in a memory-mapped `.npy` file \
+    of shape `(height, width, channels)`, one band at a time
+    '''
+
+    def __init__(
+            self,
+            path: str,
+            size: tuple,
+            mode: str,
+
+            compression_level: int = None,
+            state: dict = None
+        ) -> None:
+
+        if state:
+            self.array = np.lib.format.open_memmap(path, mode = 'r+')
+            self.row = state['row']
+
+            return
+
+        self.array = np.lib.format.open_memmap(
+            path,
+            mode = 'w+',
+            dtype = np.uint8,
+            shape = (size[1], size[0], len(mode))
+        )
+
+        self.row = 0
+
+
+
+    def write(self, band) -> None:
+        '''
+        writes the `(rows, width, channels)` uint8 array `band`
+        '''
+
+        self.array[self.row:self.row + len(band)] = band
+        self.row += len(band)
+
+
+
+    def checkpoint(self) -> dict:
+        '''
+        same as `PNGWriter.checkpoint`
+        '''
+
+        self.array.flush()
+
+        return {'row': self.row}
+
+
+
+    def close(self) -> None:
+        self.array.flush()
+        del self.array
+
+
+
+STREAM_FORMATS = {
+    'png': PNGWriter,
+    'tif': TIFFWriter,
+    'tiff': TIFFWriter,
+    'npy': NPYWriter
+}
+
+
+
+def open_writer(
+        path: str,
+        size: tuple,
+        mode: str,
+
+        compression_level: int = 6,
+        state: dict = None
+    ):
+    '''
+    returns the writer for the format of `path`, one of `STREAM_FORMATS`. \
+    bands written with `write` must be written top to bottom, \
+    and `close` must be called at the end.
+
+    `state`, returned by the `checkpoint` of a writer of the same file, \
+    opens that file again to go on writing from there
+    '''
+
+    return STREAM_FORMATS[path.split('.')[-1].lower()](
+        path,
+        size,
+        mode,
+        compression_level,
+        state
+    )
@@ -16,6 +16,9 @@ with open('README.md', encoding = 'utf-8') as f:
         url = 'https://github.com/Zslez/Mozaiku',
         packages = ['mozaiku'],
         setup_requires = ['wheel', 'pillow'],
+        extras_require = {
+            'fast': ['numpy']
+        },
         classifiers = [
             'Programming Language :: Python :: 3',
             'Programming Language :: Python :: 3.7',